@@ -2,66 +2,68 @@
 # import folium # noqa
 
 import streamlit as st
-from streamlit_folium import st_folium  # noqa
 from utils.utils import (
-    create_map,
     display_agrid_table,
     display_camera_details,
-    get_cameras,
-    get_cameras_cache,
+    display_map,
+    end_script_run,
+    get_cameras_identifications,
+    get_cameras_identifications_age,
     get_filted_cameras_objects,
-    get_icon_color,
-    treat_data,
+    get_query_index,
+    get_vision_ai_api,
+    prepare_aggrid_table,
+    start_script_run,
 )
 
 st.set_page_config(
     page_title="Vision AI - Rio", layout="wide", initial_sidebar_state="collapsed"
 )
+script_run = start_script_run("Home")
+# asks for the login before showing the page
+get_vision_ai_api()
 # st.image("./data/logo/logo.png", width=300)
 
 DEFAULT_OBJECT = "nível da água"
 st.markdown("## Identificações | Vision AI")
 
 
+# arguments of get_cameras for the identifications shown in the page
+FETCH_KWARGS = {
+    "only_active": False,
+    "use_mock_data": False,
+    "update_mock_data": False,
+    # show the cameras that could be fetched when some pages keep failing
+    "partial": True,
+}
+
+
 # Function to fetch and update data
 def fetch_and_update_data(bypass_cash=False):
-    page_size = 3000
-    only_active = False
-    use_mock_data = False
-    update_mock_data = False
-
-    if bypass_cash:
-        return get_cameras(
-            page_size=page_size,
-            only_active=only_active,
-            use_mock_data=use_mock_data,
-            update_mock_data=update_mock_data,
-        )
-    return get_cameras_cache(
-        page_size=page_size,
-        only_active=only_active,
-        use_mock_data=use_mock_data,
-        update_mock_data=update_mock_data,
-    )
+    # served by the background refresher, bypass_cash waits for a new fetch
+    return get_cameras_identifications(bypass_cache=bypass_cash, **FETCH_KWARGS)
 
 
-cameras = fetch_and_update_data()
+cameras_identifications = fetch_and_update_data()
 # Add a button for updating data
 if st.button("Update Data"):
-    cameras = fetch_and_update_data(bypass_cash=True)
+    cameras_identifications = fetch_and_update_data(bypass_cash=True)
     st.success("Data updated successfully!")
 
+data_age = get_cameras_identifications_age(**FETCH_KWARGS)
+if data_age is not None:
+    st.caption(f"Dados atualizados há {int(data_age // 60)} min {int(data_age % 60)} s")
 
-cameras_identifications = treat_data(cameras)
 # st.dataframe(cameras_identifications)
 
 if len(cameras_identifications) > 0:
+    # lookups by object, label and camera without scanning the whole frame
+    query_index = get_query_index(cameras_identifications)
 
     col1, col2 = st.columns(2)
     with col1:
 
-        objects = cameras_identifications["object"].unique().tolist()
-        objects.sort()
+        objects = query_index.objects
         # dropdown to filter by object
         object_filter = st.selectbox(
             "Filtrar por objeto",
@@ -70,16 +72,7 @@ if len(cameras_identifications) > 0:
         )
 
     with col2:
-        labels = (
-            cameras_identifications[
-                cameras_identifications["object"] == object_filter
-            ][  # noqa
-                "label"
-            ]
-            .dropna()
-            .unique()
-            .tolist()
-        )
+        labels = query_index.labels(object_filter)
         labels_default = labels.copy()
 
         # if object_filter == "road_blockade":
@@ -96,35 +89,16 @@ if len(cameras_identifications) > 0:
         cameras_identifications_df=cameras_identifications,
         object_filter=object_filter,
         label_filter=label_filter,
+        query_index=query_index,
     )
     # make two cols
     col1, col2 = st.columns(2)
-    folium_map = create_map(cameras_identifications_filter)
+    # the map is only rendered again when the filtered rows change, selecting a
+    # camera just centers the map on it
+    map_center, map_zoom = None, None
 
     with col1:
-        selected_cols = [
-            "index",
-            "object",
-            "label",
-            "bairro",
-            "timestamp",
-            "id",
-        ]
-        aggrid_table = cameras_identifications_filter.copy()
-        aggrid_table["index"] = aggrid_table["label"].apply(
-            lambda label: get_icon_color(label=label, type="emoji")
-        )
-
-        # sort the table first by object then by the column order
-        aggrid_table = aggrid_table.sort_values(
-            by=["object", "order"], ascending=[True, True]
-        )
-
-        # capitalize the values of the columns object and label
-        aggrid_table["object"] = aggrid_table["object"].str.capitalize()
-        aggrid_table["label"] = aggrid_table["label"].str.capitalize()
-
-        aggrid_table = aggrid_table[selected_cols]
+        aggrid_table = prepare_aggrid_table(cameras_identifications_filter)
         st.markdown("### 📈 Identificações")
         selected_row = display_agrid_table(aggrid_table)  # noqa
 
@@ -136,14 +110,12 @@ if len(cameras_identifications) > 0:
             ]
             # get first row
             row = row.head(1).to_dict("records")[0]
-            camera_location = [row["latitude"], row["longitude"]]
-            folium_map = create_map(
-                cameras_identifications_filter,
-                location=camera_location,  # noqa
-            )
+            map_center, map_zoom = [row["latitude"], row["longitude"]], 16
 
             display_camera_details(
-                row=row, cameras_identifications_df=cameras_identifications
+                row=row,
+                cameras_identifications_df=cameras_identifications,
+                query_index=query_index,
             )  # noqa
         # if there is are ann object and label selected but no row is selected then select the first camera of the aggrid table
         elif object_filter and not selected_row and label_filter != []:
@@ -155,14 +127,12 @@ if len(cameras_identifications) > 0:
             ]
             # get first row
             row = row.head(1).to_dict("records")[0]
-            camera_location = [row["latitude"], row["longitude"]]
-            folium_map = create_map(
-                cameras_identifications_filter,
-                location=camera_location,  # noqa
-            )
+            map_center, map_zoom = [row["latitude"], row["longitude"]], 16
 
             display_camera_details(
-                row=row, cameras_identifications_df=cameras_identifications
+                row=row,
+                cameras_identifications_df=cameras_identifications,
+                query_index=query_index,
             )  # noqa
         else:
             st.markdown(
@@ -174,7 +144,13 @@ if len(cameras_identifications) > 0:
 
     with col1:
         st.markdown("### 📍 Mapa")
-        st_folium(folium_map, key="fig1", height=600, width="100%")
+        display_map(
+            cameras_identifications_filter,
+            center=map_center,
+            zoom=map_zoom,
+            key="fig1",
+            height=600,
+        )
 
     # for camera_id in cameras_identifications_filter.index:
     #     row = cameras_filter.loc[camera_id]
@@ -184,3 +160,5 @@ if len(cameras_identifications) > 0:
     #     time.sleep(2)
 else:
     st.error("No cameras with identifications")
+
+end_script_run(script_run)
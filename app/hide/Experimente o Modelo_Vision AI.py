@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-from utils.model import run_model
+from utils.model import FLOODING_PROMPT, run_model
 
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
@@ -13,20 +13,7 @@ my_upload = st.file_uploader("Faça upload de uma imagem", type=["png", "jpg", "
 
 prompt = st.text_area(
     label="add a prompt to the model (optional)",
-    value="""
-                You are an expert flooding detector.
-
-                You are given a image. You must detect if there is flooding in the image.
-
-                the output MUST be a json object with a boolean value for the key "flooding_detected".
-
-                If you don't know what to anwser, you can set the key "flooding_detect" as false.
-
-                Example:
-                {
-                    "flooding_detected": true
-                }
-    """,
+    value=FLOODING_PROMPT,
 )
 
 prompt
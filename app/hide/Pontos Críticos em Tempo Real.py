@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
+import io
+
 import folium
 import pandas as pd
 import requests
 import streamlit as st
 from streamlit_folium import st_folium
+from utils.cassette import install_cassette
+
+# record or replay the dados.rio responses when HTTP_CASSETTE_MODE is set
+install_cassette()
 
 st.set_page_config(layout="wide", page_title="Pontos Críticos em Tempo Real")
 st.image("./data/logo/logo.png", width=300)
@@ -46,13 +52,22 @@ def load_pontos_criticos():
 
 @st.cache_data(ttl=60)
 def load_precipitacao():
+    # read through requests, so the cassette sees them
     precipitacao_15min = pd.read_json(
-        "https://api.dados.rio/v2/clima_pluviometro/precipitacao_15min/"
+        io.StringIO(
+            requests.get(
+                "https://api.dados.rio/v2/clima_pluviometro/precipitacao_15min/"
+            ).text
+        )
     )[["id_h3", "chuva_15min", "status", "color"]].rename(
         columns={"status": "status_15min"}
     )
     precipitacao_120min = pd.read_json(
-        "https://api.dados.rio/v2/clima_pluviometro/precipitacao_120min/"
+        io.StringIO(
+            requests.get(
+                "https://api.dados.rio/v2/clima_pluviometro/precipitacao_120min/"
+            ).text
+        )
     )[["id_h3", "chuva_15min", "status"]].rename(
         columns={"chuva_15min": "chuva_120min", "status": "status_120min"}
     )
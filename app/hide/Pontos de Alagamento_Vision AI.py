@@ -2,6 +2,10 @@
 import pandas as pd
 import requests
 import streamlit as st
+from utils.cassette import install_cassette
+
+# record or replay the dados.rio responses when HTTP_CASSETTE_MODE is set
+install_cassette()
 
 st.set_page_config(layout="wide", page_title="Pontos de Alagamento")
 st.image("./data/logo/logo.png", width=300)
@@ -3,13 +3,23 @@ import json
 
 import pandas as pd
 import streamlit as st
-from utils.utils import explode_df, get_objects_cache, get_objetcs_labels_df
+from utils.utils import (
+    end_script_run,
+    explode_df,
+    get_objects_cache,
+    get_objetcs_labels_df,
+    get_vision_ai_api,
+    start_script_run,
+)
 
 st.set_page_config(
     page_title="Classificador de Labels",
     layout="wide",
     initial_sidebar_state="collapsed",
 )
+script_run = start_script_run("Classificador de Labels")
+# asks for the login before showing the page
+get_vision_ai_api()
 # st.image("./data/logo/logo.png", width=300)
 
 st.markdown("# Classificador de labels | Vision AI")
@@ -219,3 +229,5 @@ else:
         #         )
 
     st.session_state.row_index += 1  # noqa
+
+end_script_run(script_run)
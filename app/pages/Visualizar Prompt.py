@@ -4,41 +4,40 @@ import json
 import pandas as pd
 import streamlit as st
 from utils.utils import (
-    get_objects,
+    end_script_run,
+    get_catalog,
     get_objects_cache,
     get_objetcs_labels_df,
-    get_prompts,
     get_prompts_cache,
+    get_vision_ai_api,
+    start_script_run,
 )
 
 st.set_page_config(
     page_title="Visualizar Prompt", layout="wide", initial_sidebar_state="collapsed"
 )
+script_run = start_script_run("Visualizar Prompt")
+# asks for the login before showing the page
+get_vision_ai_api()
 # st.image("./data/logo/logo.png", width=300)
 
 st.markdown("# Visualizar Prompt | Vision AI")
 
 
 # Function to fetch and update data
-def fetch_and_update_prompts(bypass_cash=False):
+def fetch_and_update_data(bypass_cash=False):
     if bypass_cash:
-        return get_prompts()
-    return get_prompts_cache()
+        # fetch prompts and objects concurrently
+        catalog = get_catalog(cameras=False)
+        return catalog["prompts"], catalog["objects"]
+    return get_prompts_cache(), get_objects_cache()
 
 
-def fetch_and_update_objects(bypass_cash=False):
-    if bypass_cash:
-        return get_objects()
-    return get_objects_cache()
-
-
-prompt_data = fetch_and_update_prompts()
-objects_data = fetch_and_update_objects()
+prompt_data, objects_data = fetch_and_update_data()
 
 # Add a button for updating data
 if st.button("Update Data"):
-    prompt_data = fetch_and_update_prompts(bypass_cash=True)
-    objects_data = fetch_and_update_objects(bypass_cash=True)
+    prompt_data, objects_data = fetch_and_update_data(bypass_cash=True)
     st.success("Data updated successfully!")
 
 objects = pd.DataFrame(objects_data)
@@ -67,3 +66,5 @@ prompt_text = (
     .replace("{output_example}", output_example)
 )
 st.markdown(prompt_text)
+
+end_script_run(script_run)
@@ -1,91 +1,457 @@
 # -*- coding: utf-8 -*-
-
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from utils.auth import TokenManager
+from utils.cassette import install_cassette
+from utils.metrics import REGISTRY, endpoint_label
+from utils.paging import PageTuner
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = os.environ.get(
+    "VISION_AI_API_URL", "https://vision-ai-api-staging-ahcsotxvgq-uc.a.run.app"
+)
+
+# responses worth retrying, the request may succeed on another instance
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# hedging starts after this many pages finished, for pages running longer
+# than the hedge percentile of their latencies and at least HEDGE_MIN_DELAY
+HEDGE_MIN_SAMPLES = 4
+HEDGE_MIN_DELAY = 0.2
+HEDGE_POLL_INTERVAL = 0.05
+
+# record or replay the API responses when HTTP_CASSETTE_MODE is set
+install_cassette()
 
 
 class APIVisionAI:
-    def __init__(self, username: str, password: str) -> None:
-        self.BASE_URL = "https://vision-ai-api-staging-ahcsotxvgq-uc.a.run.app"
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        max_workers: int = 16,
+        max_connections_per_host: int = 16,
+        base_url: str = BASE_URL,
+        retries: int = 3,
+        backoff: float = 0.5,
+        hedge_percentile: Optional[float] = 0.9,
+        default_page_size: int = 100,
+    ) -> None:
+        self.BASE_URL = base_url.rstrip("/")
         self.username = username
         self.password = password
-        self.headers, self.token_renewal_time = self._get_headers()
+        # concurrency ceiling for the paginator, independent of the number of pages
+        self.max_workers = max_workers
+        # retries with jittered exponential backoff for failed requests and
+        # duplicate requests for slow pages, None disables hedging
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        # page size of each endpoint, until its first pages are measured
+        self.tuner = PageTuner(max_workers, default_page_size=default_page_size)
+        self.session = self._create_session(max_connections_per_host)
+        self._stats_lock = threading.Lock()
+        self.tokens = TokenManager(self._get_headers)
+        self.tokens.refresh()
+
+    def _create_session(self, max_connections_per_host: int) -> requests.Session:
+        # keep-alive pool shared by every request of this client. pool_block
+        # makes the threads wait for a free connection instead of opening
+        # extra ones, so a single host never gets more than the limit
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     def _get_headers(self) -> Tuple[Dict[str, str], float]:
-        access_token_response = requests.post(
+        response = self.session.post(
             f"{self.BASE_URL}/auth/token",
             data={"username": self.username, "password": self.password},
-        ).json()
-        token = access_token_response["access_token"]
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
         return {"Authorization": f"Bearer {token}"}, time.time()
 
-    def _refresh_token_if_needed(self) -> None:
-        if time.time() - self.token_renewal_time >= 60 * 50:
-            self.headers, self.token_renewal_time = self._get_headers()
+    @property
+    def headers(self) -> Dict[str, str]:
+        return self.tokens.headers()
 
-    def _get(self, path: str, timeout: int = 120) -> Dict:
-        self._refresh_token_if_needed()
-        response = requests.get(
-            f"{self.BASE_URL}{path}", headers=self.headers, timeout=timeout
+    def _send(self, path, headers, timeout, stats) -> requests.Response:
+        endpoint = endpoint_label(path)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{self.BASE_URL}{path}", headers=headers, timeout=timeout
+            )
+        except requests.RequestException as exc:
+            REGISTRY.inc(
+                "vision_ai_request_errors_total",
+                endpoint=endpoint,
+                error=type(exc).__name__,
+            )
+            raise
+        REGISTRY.observe(
+            "vision_ai_request_seconds",
+            time.perf_counter() - start,
+            endpoint=endpoint,
+            status=response.status_code,
+        )
+        REGISTRY.inc(
+            "vision_ai_response_bytes_total", len(response.content), endpoint=endpoint
         )
+        if response.status_code >= 400:
+            REGISTRY.inc(
+                "vision_ai_request_errors_total",
+                endpoint=endpoint,
+                error=str(response.status_code),
+            )
+        if stats is not None:
+            with self._stats_lock:
+                stats["requests"] += 1
+                stats["bytes"] += len(response.content)
+        return response
+
+    @staticmethod
+    def new_stats() -> Dict[str, int]:
+        # requests and response bytes used by a fetch, filled by _get, and how
+        # the paginator coped with slow and failing pages
+        return {
+            "requests": 0,
+            "bytes": 0,
+            "retries": 0,
+            "hedged": 0,
+            "failed_pages": [],
+        }
+
+    def _get(self, path: str, timeout: int = 120, stats: Optional[Dict] = None) -> Dict:
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._get_once(path, timeout, stats)
+                if response.status_code not in RETRY_STATUS:
+                    break
+                if attempt == self.retries:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            REGISTRY.inc("vision_ai_retries_total", endpoint=endpoint_label(path))
+            if stats is not None:
+                with self._stats_lock:
+                    stats["retries"] += 1
+            # full jitter, so the retries of many threads don't arrive together
+            time.sleep(random.uniform(0, self.backoff * 2**attempt))
         response.raise_for_status()
         return response.json()
 
-    def _get_all_pages(self, path, page_size=100, timeout=120):
-        # Function to get a single page
-        def get_page(page, total_pages):
-            # time each execution
+    def _get_once(self, path, timeout, stats) -> requests.Response:
+        headers = self.tokens.headers()
+        response = self._send(path, headers, timeout, stats)
+        if response.status_code == 401:
+            # token revoked or expired early: one re-auth shared by all the
+            # threads that got a 401 with this token, then the request is replayed
+            headers = self.tokens.refresh(stale=headers)
+            response = self._send(path, headers, timeout, stats)
+        return response
 
-            start = time.time()
-            response = self._get(path=page, timeout=timeout)
-            print(
-                f"Page {page} out {total_pages} took {round(time.time() - start,2)} seconds"  # noqa
-            )
-            return response
-
-        if isinstance(path, str):
-            print(f"Getting all pages for {path}")
-            # Initial request to determine the number of pages
-            initial_response = self._get(
-                path=f"{path}?page=1&size=1", timeout=timeout
-            )  # noqa
-            if not initial_response:
-                return []
+    def _merge_stats(self, stats: Optional[Dict], item_stats: Dict) -> None:
+        if stats is not None:
+            with self._stats_lock:
+                for key in ["requests", "bytes", "retries"]:
+                    stats[key] += item_stats[key]
 
-            # Assuming the initial response contains the total number of items or pages # noqa
-            total_pages = self._calculate_total_pages(
-                initial_response, page_size
-            )  # noqa
-            pages = [
-                f"{path}?page={page}&size={page_size}"
-                for page in range(1, total_pages + 1)  # noqa
-            ]
-
-        elif isinstance(path, list):
-            total_pages = len(path)
-            pages = path
+    def _get_page(
+        self, page: str, timeout=120, stats=None, endpoint=None
+    ) -> Tuple[Dict, float]:
+        # fetches a page and returns it with its latency, also recorded per
+        # request in the metrics. Pages of an endpoint that needed no retry
+        # feed its page size model
+        page_stats = self.new_stats()
+        start = time.time()
+        response = self._get(path=page, timeout=timeout, stats=page_stats)
+        latency = time.time() - start
+        self._merge_stats(stats, page_stats)
+        if endpoint is not None and not page_stats["retries"]:
+            items = len(self._extract_items(response)) if response else 0
+            self.tuner.observe(endpoint, items, latency, page_stats["bytes"])
+        return response, latency
+
+    def _plan_pages(self, path, page_size=None, total=None) -> Tuple[int, int]:
+        # page size and concurrency for a paginated path, page_size=None lets
+        # the tuner pick it from the previous fetches of the path
+        page_size, concurrency = self.tuner.plan(path, page_size=page_size, total=total)
+        endpoint = endpoint_label(path)
+        REGISTRY.set("vision_ai_page_size", page_size, endpoint=endpoint)
+        REGISTRY.set("vision_ai_page_concurrency", concurrency, endpoint=endpoint)
+        return page_size, concurrency
+
+    def _get_pages_paths(self, path, page_size, total, first_page=1) -> List[str]:
+        total_pages = self._calculate_total_pages({"total": total}, page_size)
+        return [
+            f"{path}?page={page}&size={page_size}"
+            for page in range(first_page, total_pages + 1)  # noqa
+        ]
 
+    @staticmethod
+    def _extract_items(response) -> List[Dict]:
+        items = response.get("items", response)
+        if isinstance(items, list):
+            return items
+        elif isinstance(items, dict):
+            return [items]
+        return []
+
+    def _hedge_after(self, latencies: List[float]) -> Optional[float]:
+        # pages running longer than this get a duplicate request, once enough
+        # pages finished to know what a slow page is
+        if self.hedge_percentile is None or len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))
+        return max(latencies[index], HEDGE_MIN_DELAY)
+
+    def _get_all_pages(
+        self, path, page_size=None, timeout=120, stats=None, total=None, partial=False
+    ):
+        # path is a paginated path or a list of paths fetched as they are.
+        # Page 1 is fetched at full size and its total plans the other pages,
+        # unless the caller already knows the total. With partial=True the
+        # pages that fail after the retries are skipped and listed in
+        # stats["failed_pages"] instead of failing the fetch
+        stats = self.new_stats() if stats is None else stats
+        if isinstance(path, list):
+            return self._fetch_pages(path, self.max_workers, timeout, stats, partial)
+
+        logger.info("Getting all pages for %s", path)
+        start = time.time()
+        page_size, concurrency = self._plan_pages(path, page_size, total)
         data = []
-        with ThreadPoolExecutor(max_workers=total_pages) as executor:
+        if total is None:
+            first_page = f"{path}?page=1&size={page_size}"
+            try:
+                response, _ = self._get_page(first_page, timeout, stats, path)
+            except Exception:
+                if not partial:
+                    raise
+                with self._stats_lock:
+                    stats["failed_pages"].append(first_page)
+                logger.warning("Failed pages: %s", [first_page])
+                return []
+            if not response:
+                return []
+            data.extend(self._extract_items(response))
+            total = response.get("total", len(data))
+            # the first page planned with the total seen before, if any
+            _, concurrency = self._plan_pages(path, page_size, total)
+            pages = self._get_pages_paths(path, page_size, total, first_page=2)
+        else:
+            pages = self._get_pages_paths(path, page_size, total)
+        self.tuner.observe_total(path, total)
+
+        data.extend(
+            self._fetch_pages(pages, concurrency, timeout, stats, partial, path)
+        )
+        seconds = time.time() - start
+        with self._stats_lock:
+            stats.setdefault("paging", {})[path] = {
+                "page_size": page_size,
+                "concurrency": concurrency,
+                "pages": self._calculate_total_pages({"total": total}, page_size),
+                "items_per_second": round(len(data) / seconds) if seconds else None,
+                **self.tuner.report(path),
+            }
+        return data
+
+    def _fetch_pages(
+        self, pages, concurrency, timeout=120, stats=None, partial=False, endpoint=None
+    ):
+        if not pages:
+            return []
+        started = {}
+
+        def get_page(page):
+            started.setdefault(page, time.time())
+            return self._get_page(page, timeout=timeout, stats=stats, endpoint=endpoint)
+
+        data, latencies, errors = [], [], {}
+        max_workers = min(concurrency, len(pages))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        hedge_executor = ThreadPoolExecutor(max_workers=max(1, max_workers // 4))
+        try:
             # Create a future for each page
-            futures = [
-                executor.submit(get_page, page, total_pages) for page in pages  # noqa
-            ]
-
-            for future in as_completed(futures):
-                response = future.result()
-                items = response.get("items", response)
-                if isinstance(items, list):
-                    data.extend(items)
-                elif isinstance(items, dict):
-                    data.append(items)
-
-        print("Getting all pages done!!!")
+            futures = {executor.submit(get_page, page): page for page in pages}
+            # requests in flight of each unfinished page. A page is hedged at
+            # most once, and never after one of its requests failed
+            running = {page: 1 for page in pages}
+            hedged = set()
+            pending = set(futures)
+            while pending:
+                done, pending = wait(
+                    pending, timeout=HEDGE_POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    page = futures[future]
+                    if page not in running:
+                        continue  # the other request of a hedged page won
+                    running[page] -= 1
+                    try:
+                        response, latency = future.result()
+                    except Exception as exc:
+                        errors[page] = exc
+                        if running[page] == 0:
+                            del running[page]
+                            if not partial:
+                                raise
+                        continue
+                    del running[page]
+                    errors.pop(page, None)
+                    latencies.append(latency)
+                    data.extend(self._extract_items(response))
+                # the loser of a hedged page is not waited for
+                pending = {future for future in pending if futures[future] in running}
+
+                hedge_after = self._hedge_after(latencies)
+                if hedge_after is None:
+                    continue
+                now = time.time()
+                for future in list(pending):
+                    page = futures[future]
+                    if (
+                        page not in hedged
+                        and page not in errors
+                        and page in started
+                        and now - started[page] > hedge_after
+                    ):
+                        hedge = hedge_executor.submit(get_page, page)
+                        futures[hedge] = page
+                        hedged.add(page)
+                        running[page] += 1
+                        pending.add(hedge)
+                        REGISTRY.inc(
+                            "vision_ai_hedged_total", endpoint=endpoint_label(page)
+                        )
+                        with self._stats_lock:
+                            stats["hedged"] += 1
+        finally:
+            # slow requests that lost to their hedge are not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+            hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+        if errors:
+            with self._stats_lock:
+                stats["failed_pages"].extend(errors)
+            logger.warning("Failed pages: %s", list(errors))
+        logger.info("Getting all pages done")
         return data
 
-    def _calculate_total_pages(self, response, page_size):
-        print(response)
-        return round(response["total"] / page_size) + 1
+    @staticmethod
+    def _calculate_total_pages(response, page_size):
+        return math.ceil(response["total"] / page_size)
+
+
+# Asyncio counterpart of APIVisionAI. Requests reuse the pooled session and the
+# token of the wrapped client and run on a bounded executor, so pages (and several
+# endpoints gathered on one event loop) are consumed as soon as each one arrives
+class AsyncAPIVisionAI:
+    def __init__(self, api: APIVisionAI) -> None:
+        self.api = api
+        self._executor = ThreadPoolExecutor(max_workers=api.max_workers)
+        self._semaphore = None
+
+    async def __aenter__(self) -> "AsyncAPIVisionAI":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, func, *args):
+        # the semaphore is created lazily so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.api.max_workers)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def get(self, path: str, timeout: int = 120, stats=None) -> Dict:
+        return await self._run(self.api._get, path, timeout, stats)
+
+    async def get_page(self, page: str, timeout: int = 120, stats=None, endpoint=None):
+        response, _ = await self._run(
+            self.api._get_page, page, timeout, stats, endpoint
+        )
+        return response
+
+    async def iter_pages(
+        self, path, page_size=None, timeout=120, stats=None, total=None
+    ) -> AsyncIterator[List[Dict]]:
+        # yields the items of each page in completion order. As in
+        # APIVisionAI._get_all_pages, page 1 is fetched first at full size
+        # when the total is not known and its total plans the other pages
+        endpoint, concurrency = None, self.api.max_workers
+        if isinstance(path, list):
+            pages = path
+        else:
+            endpoint = path
+            page_size, concurrency = self.api._plan_pages(path, page_size, total)
+            first_page = 1
+            if total is None:
+                response = await self.get_page(
+                    f"{path}?page=1&size={page_size}", timeout, stats, endpoint
+                )
+                if not response:
+                    return
+                yield self.api._extract_items(response)
+                total, first_page = response.get("total", 0), 2
+                _, concurrency = self.api._plan_pages(path, page_size, total)
+            self.api.tuner.observe_total(path, total)
+            pages = self.api._get_pages_paths(path, page_size, total, first_page)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_page(page):
+            async with semaphore:
+                return await self.get_page(page, timeout, stats, endpoint)
+
+        tasks = [asyncio.ensure_future(get_page(page)) for page in pages]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield self.api._extract_items(await task)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iter_items(
+        self, path, page_size=None, timeout=120, stats=None
+    ) -> AsyncIterator[Dict]:
+        async for items in self.iter_pages(
+            path, page_size=page_size, timeout=timeout, stats=stats
+        ):
+            for item in items:
+                yield item
+
+    async def get_all_pages(
+        self, path, page_size=None, timeout=120, stats=None, total=None
+    ) -> List[Dict]:
+        data = []
+        async for items in self.iter_pages(
+            path, page_size=page_size, timeout=timeout, stats=stats, total=total
+        ):
+            data.extend(items)
+        return data
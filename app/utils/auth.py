@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# tokens of the API are renewed after this many seconds
+TOKEN_LIFETIME = 60 * 50
+
+
+class TokenManager:
+    """
+    Bearer token shared by every thread of a client. Only one refresh is in
+    flight at a time: threads that waited for it reuse the new token. The
+    token is renewed in background shortly before it expires, so requests
+    don't wait for the token endpoint.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Tuple[Dict[str, str], float]],
+        lifetime: float = TOKEN_LIFETIME,
+        refresh_margin: float = 60 * 5,
+    ) -> None:
+        # fetch returns the auth headers and the time they were issued
+        self._fetch = fetch
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._headers = None
+        self._issued_at = None
+        self.refreshes = 0
+
+    def headers(self) -> Dict[str, str]:
+        headers, issued_at = self._headers, self._issued_at
+        if headers is None or time.time() - issued_at >= self.lifetime:
+            return self.refresh(stale=headers)
+        if time.time() - issued_at >= self.lifetime - self.refresh_margin:
+            self._refresh_in_background(headers)
+        return headers
+
+    def refresh(self, stale: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        # stale are the headers the caller saw expire or get a 401. If another
+        # thread already replaced them, its token is returned without a new call
+        with self._lock:
+            if self._headers is not None and self._headers is not stale:
+                return self._headers
+            self._headers, self._issued_at = self._fetch()
+            self.refreshes += 1
+            return self._headers
+
+    def _refresh_in_background(self, stale: Dict[str, str]) -> None:
+        if not self._background_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self.refresh(stale=stale)
+            except Exception as exc:
+                # the current token is still valid, the next request retries
+                logger.warning("Background token refresh failed: %r", exc)
+            finally:
+                self._background_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
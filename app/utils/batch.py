@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Classifies a batch of images with the vision model. The images come from a
+CSV (its image_url column, or the first one), a directory or a text file
+with one URL or path per line. Downloads and encodes run on a thread pool,
+at most max_inflight model calls run at once and every result is appended
+to a JSON lines file as soon as it comes. A run that stops picks up where
+it left: images already classified are skipped, failed ones tried again.
+
+With --gate, snapshots of a camera that barely changed since its last
+classified one take its label instead of being classified. With
+--prefilter, the snapshots the water prefilter of PREFILTER_PATH scores as
+dry are labeled false without calling the model, only with the flooding
+prompt.
+
+  PYTHONPATH=app python -m utils.batch SOURCE --output results.jsonl
+      [--prompt PATH] [--workers N] [--inflight N] [--gate]
+      [--change-threshold T] [--prefilter]
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from utils.change import ChangeGate, camera_of, thumbnail
+from utils.model import FLOODING_PROMPT, classify_image, get_ai_label
+from utils.prefilter import PREFILTER_PATH, load_prefilter
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# prints the progress every this many images
+REPORT_EVERY = 50
+# snapshots downloaded and gated together, at most, with a ChangeGate
+GATE_CHUNK_SIZE = 512
+
+
+def list_images(source):
+    # URLs or paths of the images of a CSV, directory or list file
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return [
+            os.path.join(source, name)
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    with open(source, newline="") as f:
+        if source.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+            if not rows:
+                return []
+            column = "image_url" if "image_url" in rows[0] else next(iter(rows[0]))
+            return [row[column] for row in rows if row[column]]
+        return [line.strip() for line in f if line.strip()]
+
+
+def read_image(image, session, timeout=None):
+    # downloads the URLs, paths are read when they are encoded
+    if image.startswith(("http://", "https://")):
+        response = session.get(image, timeout=timeout)
+        response.raise_for_status()
+        return io.BytesIO(response.content)
+    return image
+
+
+def read_results(output_path):
+    # results of a previous run, by image. A line cut short by a crash is
+    # ignored and ended, so the next results start on their own line
+    results = {}
+    if not os.path.exists(output_path):
+        return results
+    with open(output_path, "rb+") as f:
+        lines = f.read().split(b"\n")
+        if lines[-1]:
+            f.write(b"\n")
+    for line in lines:
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        results[result["image"]] = result
+    return results
+
+
+def create_session(max_connections_per_host):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=max_connections_per_host,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def snapshot_waves(images):
+    # the n-th wave has the n-th snapshot of every camera, in the order of
+    # the images, so a wave is gated against the one classified before it
+    by_camera = {}
+    for image in images:
+        by_camera.setdefault(camera_of(image), []).append(image)
+    n_waves = max(map(len, by_camera.values()), default=0)
+    return [
+        [snapshots[n] for snapshots in by_camera.values() if n < len(snapshots)]
+        for n in range(n_waves)
+    ]
+
+
+def classify_batch(
+    images,
+    output_path,
+    prompt=FLOODING_PROMPT,
+    workers=16,
+    max_inflight=8,
+    timeout=120,
+    session=None,
+    gate=None,
+    prefilter=None,
+):
+    # appends a {"image", "label"} or {"image", "error"} line per image to
+    # output_path and returns the counts and the images per second. With a
+    # ChangeGate, the snapshots of a camera that didn't change since its
+    # last classified one take its label, and its image as "carried_from".
+    # With a WaterPrefilter, the ones it scores as dry aren't sent to the
+    # model, see classify_image
+    previous = read_results(output_path)
+    images = list(dict.fromkeys(images))
+    todo = [image for image in images if "label" not in previous.get(image, {})]
+    session = session or create_session(workers)
+    inflight = threading.BoundedSemaphore(max_inflight)
+    stats = {
+        "images": len(todo),
+        "skipped": len(images) - len(todo),
+        "classified": 0,
+        "carried": 0,
+        "failed": 0,
+    }
+
+    def classify(image, data=None):
+        start = time.perf_counter()
+        try:
+            if data is None:
+                data = read_image(image, session, timeout)
+            response = classify_image(
+                data, prompt, session, timeout, limit=inflight, prefilter=prefilter
+            )
+            label = get_ai_label(response)
+            if label == "Error":
+                result = {"image": image, "error": str(response["error"])}
+            else:
+                result = {"image": image, "label": label}
+            if "prefilter_score" in response:
+                result["prefilter_score"] = round(response["prefilter_score"], 4)
+        except Exception as exc:
+            result = {"image": image, "error": repr(exc)}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def fetch(image):
+        # the snapshot and its thumbnail. Failures are left to classify
+        try:
+            data = read_image(image, session, timeout)
+            return data, thumbnail(data)
+        except Exception:
+            return None, None
+
+    start = time.perf_counter()
+    done_count = 0
+    with open(output_path, "a") as f, ThreadPoolExecutor(workers) as executor:
+
+        def write(result):
+            nonlocal done_count
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
+            if "carried_from" in result:
+                stats["carried"] += 1
+            else:
+                stats["classified" if "label" in result else "failed"] += 1
+            done_count += 1
+            if done_count % REPORT_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    "%s/%s images, %.1f images/s",
+                    done_count,
+                    len(todo),
+                    done_count / elapsed,
+                )
+
+        def run(tasks):
+            # submits a few images ahead of the workers, not all of them
+            queue = iter(tasks)
+            pending = set()
+            while True:
+                for image, data in queue:
+                    pending.add(executor.submit(classify, image, data))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        if gate is None:
+            chunks = [todo]
+        else:
+            chunks = []
+            for wave in snapshot_waves(todo):
+                for start_index in range(0, len(wave), GATE_CHUNK_SIZE):
+                    end_index = start_index + GATE_CHUNK_SIZE
+                    chunks.append(wave[start_index:end_index])
+        for chunk in chunks:
+            tasks = [(image, None) for image in chunk]
+            thumbnails = {}
+            if gate is not None:
+                fetched = list(executor.map(fetch, chunk))
+                gated = [
+                    (image, data, thumb)
+                    for image, (data, thumb) in zip(chunk, fetched)
+                    if thumb is not None
+                ]
+                tasks = [
+                    (image, None)
+                    for image, (_, thumb) in zip(chunk, fetched)
+                    if thumb is None
+                ]
+                changed = []
+                if gated:
+                    changed = gate.changed(
+                        [camera_of(image) for image, _, _ in gated],
+                        np.stack([thumb for _, _, thumb in gated]),
+                    )
+                for (image, data, thumb), is_changed in zip(gated, changed):
+                    if is_changed:
+                        tasks.append((image, data))
+                        thumbnails[image] = thumb
+                        continue
+                    last = gate.result(camera_of(image))
+                    write(
+                        {
+                            "image": image,
+                            "label": last["label"],
+                            "carried_from": last["image"],
+                            "seconds": 0.0,
+                        }
+                    )
+            for result in run(tasks):
+                write(result)
+                if result["image"] in thumbnails and "label" in result:
+                    gate.update(
+                        camera_of(result["image"]), thumbnails[result["image"]], result
+                    )
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["images_per_second"] = (
+        round(len(todo) / stats["seconds"], 2) if stats["seconds"] else 0
+    )
+    if gate is not None:
+        stats["calls_avoided"] = round(gate.skipped_fraction, 4)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("source", help="CSV, directory or file with one URL a line")
+    parser.add_argument("--output", required=True, help="JSON lines results")
+    parser.add_argument("--prompt", help="file with the prompt")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--inflight", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument(
+        "--gate",
+        action="store_true",
+        help="carry the label of unchanged snapshots of the same camera",
+    )
+    parser.add_argument("--change-threshold", type=float, default=None)
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="label false the snapshots the water prefilter scores as dry",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    prompt = FLOODING_PROMPT
+    if args.prompt:
+        with open(args.prompt) as f:
+            prompt = f.read()
+    prefilter = None
+    if args.prefilter:
+        if prompt != FLOODING_PROMPT:
+            parser.error("--prefilter only answers the flooding prompt")
+        prefilter = load_prefilter()
+        if prefilter is None:
+            parser.error(f"no trained prefilter at {PREFILTER_PATH}")
+    stats = classify_batch(
+        list_images(args.source),
+        args.output,
+        prompt,
+        workers=args.workers,
+        max_inflight=args.inflight,
+        timeout=args.timeout,
+        gate=ChangeGate(args.change_threshold) if args.gate else None,
+        prefilter=prefilter,
+    )
+    print(
+        f"{stats['classified']} classified, {stats['carried']} carried,"
+        f" {stats['failed']} failed, {stats['skipped']} already done,"
+        f" {stats['images_per_second']} images/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.metrics import REGISTRY
+
+# files are hashed in chunks of this many bytes
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def content_key(image, *parts: str) -> str:
+    # sha256 of the parts and the bytes of the image, a path or a file-like
+    # object as the uploads
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    else:
+        digest.update(image.getbuffer())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    JSON results by key, kept in memory in least recently used order and in
+    a SQLite file so they survive restarts. Holds at most max_entries
+    results, each for ttl seconds when given.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 10000,
+        ttl: Optional[float] = None,
+        name: str = "results",
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results"
+                " (key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+            )
+            # the order of use isn't saved, the oldest results go first
+            for key, value, created_at in self._db.execute(
+                "SELECT key, value, created_at FROM results ORDER BY created_at"
+            ):
+                self._entries[key] = (json.loads(value), created_at)
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _delete(self, keys) -> None:
+        if self._db is not None and keys:
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM results WHERE key = ?", [(key,) for key in keys]
+                )
+
+    def _evict(self) -> None:
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        self._delete(evicted)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                self._delete([key])
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        REGISTRY.inc(
+            "result_cache_total",
+            cache=self.name,
+            result="miss" if entry is None else "hit",
+        )
+        return None if entry is None else entry[0]
+
+    def put(self, key: str, value) -> None:
+        created_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                        (key, json.dumps(value), created_at),
+                    )
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._delete(list(self._entries))
+            self._entries.clear()
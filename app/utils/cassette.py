@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# "record" saves every response the app gets, "replay" answers every request
+# from the cassette without touching the network. Unset leaves HTTP alone
+CASSETTE_MODE = os.environ.get("HTTP_CASSETTE_MODE", "")
+CASSETTE_PATH = os.environ.get("HTTP_CASSETTE", "./data/cassettes/cassette.jsonl")
+# replayed responses wait their recorded time multiplied by this, 0 for none
+CASSETTE_LATENCY_SCALE = float(os.environ.get("HTTP_CASSETTE_LATENCY_SCALE", "1"))
+
+# headers that describe the transfer, not the recorded body
+TRANSFER_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+# the requests to the token endpoint carry the credentials and its responses
+# the bearer token: neither is written to the cassette, a placeholder is
+REDACTED = "REDACTED"
+AUTH_PATHS = ("/auth/token",)
+SECRET_FIELDS = {"access_token", "refresh_token", "id_token"}
+
+
+class CassetteMiss(requests.ConnectionError):
+    # a replayed request that was never recorded, as if the network was down
+    pass
+
+
+def is_auth(request: requests.PreparedRequest) -> bool:
+    return urlsplit(request.url).path.endswith(AUTH_PATHS)
+
+
+def request_key(request: requests.PreparedRequest) -> str:
+    # method, URL with sorted query and a hash of the body. Headers are left
+    # out, so a new token or user agent still matches the recording. The body
+    # of the auth calls, the credentials, is left out too
+    url = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    url = urlunsplit((url.scheme, url.netloc, url.path, query, ""))
+    if is_auth(request):
+        return f"{request.method} {url} {REDACTED}"
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return f"{request.method} {url} {hashlib.sha256(body).hexdigest()[:16]}"
+
+
+def redact_token(text: str) -> str:
+    # the token response with its secrets replaced, or only the placeholder
+    # when it isn't a JSON object
+    try:
+        token = json.loads(text)
+    except ValueError:
+        return REDACTED
+    if not isinstance(token, dict):
+        return REDACTED
+    return json.dumps(
+        {
+            name: REDACTED if name in SECRET_FIELDS else value
+            for name, value in token.items()
+        }
+    )
+
+
+class Cassette:
+    """
+    Responses of every outbound request, appended to a JSON lines file as
+    they are recorded. On replay, the responses of a request come back in the
+    order they were recorded, the last one repeating, each after its
+    recorded latency times latency_scale.
+    """
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0) -> None:
+        if mode not in ["record", "replay"]:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._interactions = {}
+        self._played = {}
+        if mode == "replay":
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._interactions.setdefault(interaction["key"], []).append(
+                            interaction
+                        )
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, request, response: requests.Response, elapsed: float) -> None:
+        content = response.content
+        try:
+            body = {"text": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            body = {"base64": base64.b64encode(content).decode("ascii")}
+        if is_auth(request):
+            body = {"text": redact_token(body.get("text", ""))}
+        interaction = {
+            "key": request_key(request),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in TRANSFER_HEADERS
+            },
+            "elapsed": elapsed,
+            **body,
+        }
+        line = json.dumps(interaction, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+    def play(self, request) -> requests.Response:
+        key = request_key(request)
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise CassetteMiss(f"Not in the cassette: {key}", request=request)
+            played = self._played.get(key, 0)
+            self._played[key] = played + 1
+        interaction = interactions[min(played, len(interactions) - 1)]
+        if self.latency_scale:
+            time.sleep(interaction["elapsed"] * self.latency_scale)
+
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        if "base64" in interaction:
+            response._content = base64.b64decode(interaction["base64"])
+        else:
+            response._content = interaction["text"].encode("utf-8")
+        response.headers["Content-Length"] = str(len(response._content))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=interaction["elapsed"])
+        return response
+
+
+_cassette = None
+_install_lock = threading.Lock()
+
+
+def install_cassette(
+    path: Optional[str] = None,
+    mode: Optional[str] = None,
+    latency_scale: Optional[float] = None,
+) -> Optional[Cassette]:
+    # routes every request made through requests (sessions, requests.get,
+    # requests.post) through the cassette. Without a mode, here or in
+    # HTTP_CASSETTE_MODE, nothing is installed
+    global _cassette
+    mode = mode or CASSETTE_MODE
+    if not mode:
+        return None
+    with _install_lock:
+        if _cassette is not None:
+            return _cassette
+        _cassette = Cassette(
+            path or CASSETTE_PATH,
+            mode,
+            CASSETTE_LATENCY_SCALE if latency_scale is None else latency_scale,
+        )
+        send = HTTPAdapter.send
+
+        def cassette_send(adapter, request, **kwargs):
+            if _cassette.mode == "replay":
+                return _cassette.play(request)
+            start = time.perf_counter()
+            response = send(adapter, request, **kwargs)
+            response.content  # the recorded time includes the body
+            _cassette.record(request, response, time.perf_counter() - start)
+            return response
+
+        HTTPAdapter.send = cassette_send
+        logger.info("HTTP cassette in %s mode: %s", mode, _cassette.path)
+        return _cassette
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+from PIL import Image
+
+# side of the grayscale thumbnails compared, in pixels
+THUMBNAIL_SIDE = 16
+# mean absolute difference, from 0 to 1, of the thumbnails with their mean
+# brightness removed, under which a snapshot is the same scene. JPEG noise
+# and exposure changes stay well under it, a flooded street goes over
+CHANGE_THRESHOLD = float(os.environ.get("CHANGE_THRESHOLD", "0.04"))
+
+
+def camera_of(image: str) -> str:
+    # the snapshots are named {camera id}_{capture time}
+    name = os.path.basename(unquote(urlsplit(image).path))
+    return name.split("_")[0]
+
+
+def thumbnail(image) -> np.ndarray:
+    # image is a path or a file-like object
+    if not isinstance(image, str):
+        image.seek(0)
+    with Image.open(image) as img:
+        # JPEGs are decoded straight at the closest fraction of their size
+        img.draft("L", (THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+        small = img.convert("L").resize((THUMBNAIL_SIDE, THUMBNAIL_SIDE), Image.BOX)
+    return np.asarray(small, dtype=np.uint8).reshape(-1)
+
+
+class ChangeGate:
+    """
+    Thumbnail and result of the last classified snapshot of each camera.
+    New snapshots are compared with it, all cameras at once, and the ones
+    that didn't change take its result instead of being classified.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, capacity: int = 1024):
+        self.threshold = CHANGE_THRESHOLD if threshold is None else threshold
+        self._rows: Dict[str, int] = {}
+        self._thumbnails = np.zeros((capacity, THUMBNAIL_SIDE**2), dtype=np.uint8)
+        self._results: List = []
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skipped_fraction(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    @staticmethod
+    def difference(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        # per row of thumbnails, without the difference of mean brightness
+        a = a.astype(np.float32)
+        b = b.astype(np.float32)
+        a -= a.mean(axis=1, keepdims=True)
+        b -= b.mean(axis=1, keepdims=True)
+        return np.abs(a - b).mean(axis=1) / 255
+
+    def changed(self, camera_ids: List[str], thumbnails: np.ndarray) -> np.ndarray:
+        # True for the snapshots to classify: first of their camera or
+        # different enough from the last one classified
+        rows = np.array([self._rows.get(camera, -1) for camera in camera_ids])
+        changed = np.ones(len(camera_ids), dtype=bool)
+        known = rows >= 0
+        if known.any():
+            changed[known] = (
+                self.difference(thumbnails[known], self._thumbnails[rows[known]])
+                > self.threshold
+            )
+        self.checked += len(camera_ids)
+        self.skipped += int((~changed).sum())
+        return changed
+
+    def result(self, camera_id: str):
+        return self._results[self._rows[camera_id]]
+
+    def update(self, camera_id: str, thumbnail: np.ndarray, result) -> None:
+        row = self._rows.get(camera_id)
+        if row is None:
+            row = self._rows[camera_id] = len(self._results)
+            self._results.append(None)
+            if row == len(self._thumbnails):
+                self._thumbnails = np.concatenate(
+                    [self._thumbnails, np.zeros_like(self._thumbnails)]
+                )
+        self._thumbnails[row] = thumbnail
+        self._results[row] = result
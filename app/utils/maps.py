@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+import folium
+import pandas as pd
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+from utils.taxonomy import current_taxonomy
+
+DEFAULT_LOCATION = [-22.917690, -43.413861]
+
+# columns drawn on the map, the map only changes when one of them does
+MAP_COLUMNS = ["id", "label", "latitude", "longitude", "snapshot_url"]
+
+# above this number of points the layer is clustered by default
+CLUSTER_MIN_POINTS = 1000
+
+
+class CameraLayer(JSCSSMixin, folium.MacroElement):
+    """
+    All cameras of the map as one GeoJSON layer. Styles, tooltips and popups
+    are built in the browser from the feature properties, so the page only
+    carries the data once instead of one marker, icon and popup per camera.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_colors = {{ this.colors|tojson }};
+            var {{ this.get_name() }}_renderer = L.canvas({padding: 0.5});
+            var {{ this.get_name() }} = L.geoJson({{ this.data|tojson }}, {
+                pointToLayer: function (feature, latlng) {
+                    return L.circleMarker(latlng, {
+                        renderer: {{ this.get_name() }}_renderer,
+                        radius: 7,
+                        color: "black",
+                        weight: 2,
+                        fillOpacity: 1,
+                        fillColor: {{ this.get_name() }}_colors[
+                            feature.properties.label
+                        ] || {{ this.default_color|tojson }},
+                    });
+                },
+                onEachFeature: function (feature, layer) {
+                    var p = feature.properties;
+                    layer.bindTooltip(function () {
+                        return "ID: " + p.id + "<br>Label: " + p.label;
+                    });
+                    layer.bindPopup(function () {
+                        return '<div><img src="' + p.snapshot_url
+                            + '" width="300" height="185"><br /><span>ID: '
+                            + p.id + "<br>Label: " + p.label + "</span></div>";
+                    }, {maxWidth: 320});
+                },
+            });
+            {%- if this.cluster %}
+            var {{ this.get_name() }}_cluster = L.markerClusterGroup(
+                {{ this.cluster_options|tojson }}
+            );
+            {{ this.get_name() }}_cluster.addLayer({{ this.get_name() }});
+            {{ this._parent.get_name() }}.addLayer({{ this.get_name() }}_cluster);
+            {%- else %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {%- endif %}
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data, colors, default_color, cluster=False, **cluster_options):
+        super().__init__()
+        self._name = "CameraLayer"
+        self.data = data
+        self.colors = colors
+        self.default_color = default_color
+        self.cluster = cluster
+        self.cluster_options = cluster_options
+        if cluster:
+            self.default_js = MarkerCluster.default_js
+            self.default_css = MarkerCluster.default_css
+
+
+def map_fingerprint(chart_data) -> str:
+    # changes with the filtered rows (object, labels and data) and with the
+    # colors of the taxonomy, not with the rest of the frame
+    hashes = pd.util.hash_pandas_object(chart_data[MAP_COLUMNS], index=False)
+    fingerprint = hashlib.sha256(hashes.to_numpy().tobytes())
+    fingerprint.update(current_taxonomy().version.encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def to_feature_collection(chart_data):
+    chart_data = chart_data.dropna(subset=["latitude", "longitude"])
+    properties = {
+        column: chart_data[column].astype(object).where(chart_data[column].notna(), "")
+        for column in ["id", "label", "snapshot_url"]
+    }
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+                "properties": {"id": id_, "label": label, "snapshot_url": url},
+            }
+            for longitude, latitude, id_, label, url in zip(
+                chart_data["longitude"].tolist(),
+                chart_data["latitude"].tolist(),
+                properties["id"].tolist(),
+                properties["label"].tolist(),
+                properties["snapshot_url"].tolist(),
+            )
+        ],
+    }
+
+
+def base_map(chart_data, location=None):
+    # center map on the mean of the coordinates
+    if location is not None:
+        return folium.Map(location=location, zoom_start=16)
+    if len(chart_data) > 0:
+        return folium.Map(
+            location=[chart_data["latitude"].mean(), chart_data["longitude"].mean()],
+            zoom_start=11,
+        )
+    return folium.Map(location=DEFAULT_LOCATION, zoom_start=11)
+
+
+def add_camera_layer(m, chart_data, cluster=None):
+    taxonomy = current_taxonomy()
+    labels = pd.unique(chart_data["label"].dropna())
+    colors = {label: taxonomy.color(label) for label in labels}
+    if cluster is None:
+        cluster = len(chart_data) >= CLUSTER_MIN_POINTS
+    CameraLayer(
+        to_feature_collection(chart_data),
+        colors=colors,
+        default_color=taxonomy.color(None),
+        cluster=cluster,
+        # cameras are spread all over the city, split the clusters sooner
+        maxClusterRadius=40,
+        disableClusteringAtZoom=15,
+    ).add_to(m)
+    return m
+
+
+def add_camera_markers(m, chart_data):
+    # one folium.Marker per row, kept for comparison with the layer
+    taxonomy = current_taxonomy()
+    # categorical columns only take their own categories as fill values
+    chart_data = chart_data.astype(
+        {column: object for column in chart_data.select_dtypes("category")}
+    ).fillna("")
+    for _, row in chart_data.iterrows():
+        icon_color = taxonomy.color(row["label"])
+        htmlcode = f"""<div>
+        <img src="{row["snapshot_url"]}" width="300" height="185">
+
+        <br /><span>ID: {row["id"]}<br>Label: {row["label"]}</span>
+        </div>
+        """
+        folium.Marker(
+            location=[row["latitude"], row["longitude"]],
+            # Adicionar id_camera ao tooltip
+            tooltip=f"ID: {row['id']}<br>Label: {row['label']}",
+            # Alterar a cor do ícone de acordo com o status
+            popup=htmlcode,
+            icon=folium.features.DivIcon(
+                icon_size=(15, 15),
+                icon_anchor=(7, 7),
+                html=f'<div style="width: 15px; height: 15px; background-color: {icon_color}; border: 2px solid black; border-radius: 70%;"></div>',  # noqa
+            ),
+        ).add_to(m)
+    return m
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+import bisect
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# port of the Prometheus endpoint, next to the Streamlit one
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+# upper bounds in seconds of the latency histograms
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+HELP = {
+    "vision_ai_request_seconds": "Latency of the requests to the Vision AI API.",
+    "vision_ai_response_bytes_total": "Bytes received from the Vision AI API.",
+    "vision_ai_request_errors_total": "Failed requests to the Vision AI API.",
+    "vision_ai_retries_total": "Requests to the Vision AI API sent again.",
+    "vision_ai_hedged_total": "Duplicate requests sent for slow pages.",
+    "vision_ai_page_size": "Page size of the last fetch of each endpoint.",
+    "vision_ai_page_concurrency": "Pages in flight in the last fetch of each endpoint.",
+    "stage_seconds": "Time spent in each transform and render stage.",
+    "script_run_seconds": "Time of each complete run of a page script.",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # the last count is for the values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # upper bound of the bucket holding the quantile
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    """
+    Counters, gauges and histograms of the process, labelled like Prometheus
+    metrics. Recording a value takes one lock and a bisect, so it can be
+    called for every request.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def summary(self) -> List[Dict]:
+        # one row per metric and labels, for the admin panel
+        with self._lock:
+            histograms = list(self._histograms.items())
+            rows = [
+                {
+                    "metric": name,
+                    "labels": format_labels(labels),
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                }
+                for (name, labels), histogram in histograms
+            ]
+            rows += [
+                {"metric": name, "labels": format_labels(labels), "count": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            rows += [
+                {"metric": name, "labels": format_labels(labels), "value": value}
+                for (name, labels), value in self._gauges.items()
+            ]
+        return sorted(rows, key=lambda row: (row["metric"], row["labels"]))
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = [
+                (key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in sorted(self._histograms.items())
+            ]
+        lines, described = [], set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            describe(name, "gauge")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), counts, total, count in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(
+                    f"{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = Registry()
+
+
+@functools.lru_cache(maxsize=1024)
+def endpoint_label(path: str) -> str:
+    # "/cameras/001505?page=1" -> "/cameras/{id}", so the label set stays small
+    path = path.split("?", 1)[0]
+    return re.sub(r"/[^/]*\d[^/]*", "/{id}", path) or "/"
+
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(stage: str):
+    # records the time of each call in stage_seconds{stage=...}
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                REGISTRY.observe(
+                    "stage_seconds", time.perf_counter() - start, stage=stage
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class ScriptRun:
+    # time of a page script, recorded when stop() is reached at its end.
+    # Runs cut short by st.stop or a rerun are not recorded
+    def __init__(self, page: str) -> None:
+        self.page = page
+        self.start = time.perf_counter()
+
+    def stop(self) -> None:
+        REGISTRY.observe(
+            "script_run_seconds", time.perf_counter() - self.start, page=self.page
+        )
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    # serves REGISTRY on /metrics in a daemon thread, once per process
+    global _server, _server_started
+    with _server_lock:
+        if _server_started:
+            return _server
+        _server_started = True
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = REGISTRY.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        except OSError as exc:
+            logger.warning("Metrics server not started on port %s: %r", port, exc)
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
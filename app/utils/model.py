@@ -3,33 +3,120 @@ import base64
 import io
 import json
 import os
+from contextlib import nullcontext
 
 import requests
 from PIL import Image
+from utils.cache import ResultCache, content_key
+from utils.cassette import install_cassette
+from utils.metrics import REGISTRY
 
+OPENAI_API_URL = os.environ.get(
+    "OPENAI_API_URL", "https://api.openai.com/v1/chat/completions"
+)
+OPENAI_MODEL = "gpt-4-vision-preview"
 
-def encode_image_to_base64(image):
-    # if image is str convert to BytesIO
-    if isinstance(image, str):
-        with Image.open(image) as img:
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG")
+FLOODING_PROMPT = """
+                You are an expert flooding detector.
 
-            bytes_data = buffered.getvalue()
+                You are given a image. You must detect if there is flooding in the image.
+
+                the output MUST be a json object with a boolean value for the key "flooding_detected".
+
+                If you don't know what to anwser, you can set the key "flooding_detect" as false.
+
+                Example:
+                {
+                    "flooding_detected": true
+                }
+    """
+
+# the model fits images in a 2048 px square and then their shorter side in
+# 768 px, larger images only make the requests bigger
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "2048"))
+IMAGE_MAX_SHORT_SIDE = int(os.environ.get("IMAGE_MAX_SHORT_SIDE", "768"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "75"))
+# JPEGs that need no resizing are sent as they are up to this many bytes per
+# pixel, about what re-encoding them at IMAGE_QUALITY gives
+IMAGE_PASSTHROUGH_BYTES_PER_PIXEL = 0.25
+
+# responses of the model by image, prompt and model. An empty path keeps
+# them in memory only, a max of 0 turns the cache off
+CLASSIFICATION_CACHE_PATH = os.environ.get(
+    "CLASSIFICATION_CACHE_PATH", "./data/cache/classifications.sqlite"
+)
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(
+    os.environ.get("CLASSIFICATION_CACHE_MAX_ENTRIES", "10000")
+)
+CLASSIFICATION_CACHE_TTL = float(os.environ.get("CLASSIFICATION_CACHE_TTL", "0"))
+
+RESULT_CACHE = None
+if CLASSIFICATION_CACHE_MAX_ENTRIES:
+    RESULT_CACHE = ResultCache(
+        CLASSIFICATION_CACHE_PATH,
+        CLASSIFICATION_CACHE_MAX_ENTRIES,
+        CLASSIFICATION_CACHE_TTL or None,
+        name="classifications",
+    )
+
+# record or replay the OpenAI responses when HTTP_CASSETTE_MODE is set
+install_cassette()
+
+
+def image_scale(size, max_side=None, max_short_side=None):
+    width, height = size
+    max_side = max_side or IMAGE_MAX_SIDE
+    max_short_side = max_short_side or IMAGE_MAX_SHORT_SIDE
+    return min(1.0, max_side / max(width, height), max_short_side / min(width, height))
 
-    else:
-        bytes_data = image.getvalue()
 
-    return base64.b64encode(bytes_data).decode("utf-8")
+def prepare_image(image, max_side=None, max_short_side=None, quality=None):
+    # JPEG of the image at most at the resolution the model uses. Small
+    # enough JPEGs come back as they are, without being decoded
+    if not isinstance(image, str):
+        image.seek(0)
+    with Image.open(image) as img:
+        scale = image_scale(img.size, max_side, max_short_side)
+        if img.format == "JPEG" and scale == 1:
+            if isinstance(image, str):
+                n_bytes = os.path.getsize(image)
+            else:
+                n_bytes = image.seek(0, io.SEEK_END)
+            if n_bytes <= IMAGE_PASSTHROUGH_BYTES_PER_PIXEL * img.width * img.height:
+                if isinstance(image, str):
+                    with open(image, "rb") as f:
+                        return f.read()
+                return image.getbuffer()
 
+        if scale < 1:
+            size = (
+                max(1, round(img.width * scale)),
+                max(1, round(img.height * scale)),
+            )
+            # JPEGs are decoded straight at the closest fraction of their size
+            img.draft(None, size)
+            img = img.resize(size, Image.LANCZOS)
+        if img.mode not in ["RGB", "L"]:
+            img = img.convert("RGB")
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=quality or IMAGE_QUALITY)
+        return buffered.getbuffer()
 
-def vision_ai_classify_image(base64_image, prompt):
+
+def encode_image_to_base64(image, max_side=None, max_short_side=None, quality=None):
+    # image is a path or a file-like object, as the uploads. The bytes are
+    # encoded from the buffer they were written to, without copies
+    bytes_data = prepare_image(image, max_side, max_short_side, quality)
+    return base64.b64encode(bytes_data).decode("ascii")
+
+
+def vision_ai_classify_image(base64_image, prompt, session=None, timeout=None):
     # read OPENAI_API_KEY env
     api_key = os.environ.get("OPENAI_API_KEY")
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
 
     payload = {
-        "model": "gpt-4-vision-preview",
+        "model": OPENAI_MODEL,
         "messages": [
             {
                 "role": "user",
@@ -48,8 +135,9 @@ def vision_ai_classify_image(base64_image, prompt):
         "max_tokens": 300,
     }
 
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions", headers=headers, json=payload
+    # batches share a session, so the connections are kept alive
+    response = (session or requests).post(
+        OPENAI_API_URL, headers=headers, json=payload, timeout=timeout
     )
     return response.json()
 
@@ -64,8 +152,47 @@ def get_ai_label(response):
         return json_object["flooding_detected"]
 
 
+def prefilter_response(score):
+    # shaped as the responses of the model, for get_ai_label
+    return {
+        "choices": [{"message": {"content": json.dumps({"flooding_detected": False})}}],
+        "prefilter_score": score,
+    }
+
+
+def classify_image(
+    image, prompt, session=None, timeout=None, limit=None, prefilter=None
+):
+    # response of the model for the image, from RESULT_CACHE when it was
+    # already classified with the same prompt, or from the WaterPrefilter
+    # given when it scores the image as dry. Its answer is the one of
+    # FLOODING_PROMPT, so it is only for that prompt. limit is held during
+    # the call to the model, as the semaphore of the batches
+    cache = RESULT_CACHE
+    key = None
+    if cache is not None:
+        key = content_key(image, OPENAI_MODEL, prompt)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+    if prefilter is not None:
+        score = prefilter.score(image)
+        escalated = score >= prefilter.threshold
+        REGISTRY.inc("prefilter_total", result="escalated" if escalated else "dry")
+        if not escalated:
+            return prefilter_response(score)
+
+    base64_image = encode_image_to_base64(image)
+    with limit or nullcontext():
+        response = vision_ai_classify_image(base64_image, prompt, session, timeout)
+    # errors are not kept, the next call tries again
+    if cache is not None and not response.get("error"):
+        cache.put(key, response)
+    return response
+
+
 def run_model(img, prompt):
-    base64_image = encode_image_to_base64(img)
-    response = vision_ai_classify_image(base64_image, prompt)
+    response = classify_image(img, prompt)
 
     return get_ai_label(response)
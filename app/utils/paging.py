@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# page sizes picked by the tuner stay between these bounds
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 10000
+# pages predicted to take longer than this are split, so a slow page can be
+# hedged and a failed one is cheap to retry
+TARGET_PAGE_SECONDS = 5.0
+# largest response of a single page and of all the pages in flight
+MAX_PAGE_BYTES = 32 * 1024 * 1024
+MAX_INFLIGHT_BYTES = 128 * 1024 * 1024
+# recent pages of each endpoint used to fit its latency
+SAMPLES = 32
+
+
+def fit_latency(samples: List[Tuple[int, float, int]]) -> Tuple[float, float]:
+    # least squares fit of seconds = fixed + per_item * items. When every page
+    # had the same number of items the fixed cost can't be told apart, all
+    # the time is put on the items
+    n = len(samples)
+    mean_items = sum(items for items, _, _ in samples) / n
+    mean_seconds = sum(seconds for _, seconds, _ in samples) / n
+    variance = sum((items - mean_items) ** 2 for items, _, _ in samples)
+    if variance == 0:
+        return 0.0, mean_seconds / mean_items
+    per_item = (
+        sum(
+            (items - mean_items) * (seconds - mean_seconds)
+            for items, seconds, _ in samples
+        )
+        / variance
+    )
+    per_item = max(per_item, 0.0)
+    fixed = max(mean_seconds - per_item * mean_items, 0.0)
+    return fixed, per_item
+
+
+def mean_item_bytes(samples: List[Tuple[int, float, int]]) -> Optional[float]:
+    # response bytes per item over the pages, None before the first page
+    if not samples:
+        return None
+    return sum(n_bytes for _, _, n_bytes in samples) / sum(
+        items for items, _, _ in samples
+    )
+
+
+class PageTuner:
+    """
+    Page size and concurrency of each paginated endpoint, picked from the
+    latency and size of the pages already fetched. The last seen total is
+    spread over the workers: with page latency modelled as a fixed cost per
+    request plus a cost per item, one page per worker fetches it in the least
+    time. Pages are kept under TARGET_PAGE_SECONDS and MAX_PAGE_BYTES, and
+    concurrency is bounded by the number of pages and the bytes in flight.
+    """
+
+    def __init__(self, max_workers: int, default_page_size: int = 100) -> None:
+        self.max_workers = max_workers
+        self.default_page_size = default_page_size
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _state(self, endpoint: str) -> Dict:
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = {
+                "samples": deque(maxlen=SAMPLES),
+                "total": None,
+                "page_size": None,
+            }
+        return self._endpoints[endpoint]
+
+    def observe(self, endpoint: str, items: int, seconds: float, n_bytes: int) -> None:
+        # latency and size of a page fetched without retries
+        if items <= 0:
+            return
+        with self._lock:
+            self._state(endpoint)["samples"].append((items, seconds, n_bytes))
+
+    def observe_total(self, endpoint: str, total: int) -> None:
+        with self._lock:
+            self._state(endpoint)["total"] = total
+
+    def plan(
+        self,
+        endpoint: str,
+        page_size: Optional[int] = None,
+        total: Optional[int] = None,
+    ) -> Tuple[int, int]:
+        # returns the page size and the concurrency of the next fetch. A given
+        # page_size is kept as is, only the concurrency is planned
+        with self._lock:
+            state = self._state(endpoint)
+            samples = list(state["samples"])
+            total = state["total"] if total is None else total
+            previous = state["page_size"]
+
+        item_bytes = mean_item_bytes(samples)
+        if page_size is None:
+            page_size = previous or self.default_page_size
+            if samples and total:
+                page_size = self._best_page_size(samples, total, item_bytes)
+            with self._lock:
+                self._state(endpoint)["page_size"] = page_size
+
+        concurrency = self.max_workers
+        if total is not None:
+            concurrency = min(concurrency, max(1, math.ceil(total / page_size)))
+        if item_bytes:
+            page_bytes = page_size * item_bytes
+            concurrency = min(
+                concurrency, max(1, int(MAX_INFLIGHT_BYTES // page_bytes))
+            )
+        return page_size, concurrency
+
+    def _best_page_size(self, samples, total, item_bytes) -> int:
+        fixed, per_item = fit_latency(samples)
+        # one page per worker fetches the total in the least time
+        page_size = math.ceil(total / self.max_workers)
+        if per_item > 0:
+            page_size = min(page_size, int((TARGET_PAGE_SECONDS - fixed) / per_item))
+        if item_bytes:
+            page_size = min(page_size, int(MAX_PAGE_BYTES / item_bytes))
+        return min(max(page_size, MIN_PAGE_SIZE), MAX_PAGE_SIZE)
+
+    def item_bytes(self, endpoint: str) -> Optional[float]:
+        # average response bytes per item of the pages fetched
+        with self._lock:
+            return mean_item_bytes(list(self._state(endpoint)["samples"]))
+
+    def total(self, endpoint: str) -> Optional[int]:
+        # number of items of the endpoint the last time it was paged
+        with self._lock:
+            return self._state(endpoint)["total"]
+
+    def report(self, endpoint: str) -> Dict:
+        # fitted model of an endpoint, for the fetch stats
+        with self._lock:
+            samples = list(self._state(endpoint)["samples"])
+        if not samples:
+            return {}
+        fixed, per_item = fit_latency(samples)
+        return {
+            "fixed_seconds": round(fixed, 4),
+            "item_seconds": round(per_item, 6),
+        }
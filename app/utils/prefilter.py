@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+First stage of the classification: a logistic regression over colour and
+texture features of the street, the lower half of the snapshot, that
+scores how likely water is there in a few milliseconds on the CPU. Only
+the images scoring over the threshold go to the vision model. The
+threshold is the one that kept the target recall on the flooded images
+left out while training, with the snapshots of each camera left out
+together. The weights are not saved when the recall on the cameras left
+out falls under the target.
+
+Trains on snapshots labeled by their path, images_with_label/flood/ and
+images_with_label/no_flood/ as in the bucket, or flooded*/not_flooded* as
+in data/imgs:
+
+  PYTHONPATH=app python -m utils.prefilter SOURCE [--recall R] [--output PATH]
+"""
+import argparse
+import json
+import os
+from typing import Optional
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+from PIL import Image
+
+PREFILTER_PATH = os.environ.get("PREFILTER_PATH", "./data/models/water_prefilter.json")
+# overrides the threshold saved with the weights
+PREFILTER_THRESHOLD = os.environ.get("PREFILTER_THRESHOLD", "")
+# size the snapshots are scored at
+FEATURES_SIZE = (128, 72)
+FEATURE_NAMES = [
+    "saturation_mean",
+    "saturation_std",
+    "value_mean",
+    "value_std",
+    "hue_std",
+    "brown",
+    "glare",
+    "texture",
+    "texture_ratio",
+    "value_ratio",
+]
+
+
+def water_features(image) -> np.ndarray:
+    # image is a path or a file-like object
+    if not isinstance(image, str):
+        image.seek(0)
+    with Image.open(image) as img:
+        # JPEGs are decoded straight at the closest fraction of their size
+        img.draft("RGB", FEATURES_SIZE)
+        hsv = (
+            np.asarray(
+                img.convert("RGB").resize(FEATURES_SIZE, Image.BILINEAR).convert("HSV"),
+                dtype=np.float32,
+            )
+            / 255
+        )
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    street = slice(FEATURES_SIZE[1] // 2, None)
+    sky = slice(None, FEATURES_SIZE[1] // 2)
+    # muddy water is a brownish, washed out hue
+    brown = (hue > 0.02) & (hue < 0.12) & (saturation > 0.15) & (saturation < 0.65)
+    # puddles reflect the sky, bright and without colour
+    glare = (saturation < 0.15) & (value > 0.6)
+    gradient = np.abs(np.diff(value, axis=0))[:, :-1]
+    gradient += np.abs(np.diff(value, axis=1))[:-1]
+    texture = gradient[street].mean()
+    return np.array(
+        [
+            saturation[street].mean(),
+            saturation[street].std(),
+            value[street].mean(),
+            value[street].std(),
+            hue[street].std(),
+            brown[street].mean(),
+            glare[street].mean(),
+            texture,
+            texture / (gradient[sky].mean() + 1e-3),
+            value[street].mean() / (value[sky].mean() + 1e-3),
+        ],
+        dtype=np.float32,
+    )
+
+
+def label_of(image: str) -> Optional[bool]:
+    # True for flooded, False for dry and None when the path doesn't say
+    path = unquote(urlsplit(image).path)
+    name = os.path.basename(path)
+    if "/no_flood/" in path or name.startswith("not_flooded"):
+        return False
+    if "/flood/" in path or name.startswith("flooded"):
+        return True
+    return None
+
+
+def fit_logistic(features, labels, l2=1e-2, epochs=2000, learning_rate=0.5):
+    # weights and bias, by gradient descent on the standardized features
+    weights = np.zeros(features.shape[1])
+    bias = 0.0
+    for _ in range(epochs):
+        scores = 1 / (1 + np.exp(-(features @ weights + bias)))
+        error = scores - labels
+        weights -= learning_rate * (features.T @ error / len(labels) + l2 * weights)
+        bias -= learning_rate * error.mean()
+    return weights, bias
+
+
+def threshold_for_recall(scores, labels, recall: float) -> float:
+    # highest threshold that keeps the recall on the flooded images
+    flooded = np.sort(scores[labels.astype(bool)])
+    if not len(flooded):
+        return 0.0
+    n_missed = int(np.floor(len(flooded) * (1 - recall)))
+    return float(np.nextafter(flooded[n_missed], -np.inf))
+
+
+def group_folds(groups, folds: int, seed: int = 0) -> list:
+    # indexes of the images of each fold, with all the snapshots of a camera
+    # in the same fold so none is scored by a model trained on its camera
+    names, codes = np.unique(np.asarray(groups), return_inverse=True)
+    if len(names) < 2:
+        raise ValueError("cross-validation needs snapshots of two cameras at least")
+    order = np.random.default_rng(seed).permutation(len(names))
+    return [
+        np.flatnonzero(np.isin(codes, part))
+        for part in np.array_split(order, min(folds, len(names)))
+    ]
+
+
+class WaterPrefilter:
+    """
+    Logistic regression over water_features, with the mean and scale of the
+    features it was trained on and the threshold under which images are
+    taken as dry without asking the vision model.
+    """
+
+    def __init__(self, weights, bias, mean, scale, threshold=0.5):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.threshold = float(threshold)
+
+    def score_features(self, features: np.ndarray) -> np.ndarray:
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        return 1 / (1 + np.exp(-logits))
+
+    def score(self, image) -> float:
+        return float(self.score_features(water_features(image)[None])[0])
+
+    @classmethod
+    def fit(cls, features, labels, recall=0.98, folds=5, seed=0, groups=None):
+        # the threshold comes from the scores of each fold by the model
+        # trained on the other folds, the weights from all the images. groups
+        # are the cameras of the images, each image is its own when None
+        features = np.asarray(features, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.float32)
+        if groups is None:
+            groups = np.arange(len(labels))
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        standardized = (features - mean) / scale
+
+        scores = np.zeros(len(labels))
+        for fold in group_folds(groups, folds, seed):
+            train = np.setdiff1d(np.arange(len(labels)), fold)
+            weights, bias = fit_logistic(standardized[train], labels[train])
+            scores[fold] = 1 / (1 + np.exp(-(standardized[fold] @ weights + bias)))
+        threshold = threshold_for_recall(scores, labels, recall)
+
+        weights, bias = fit_logistic(standardized, labels)
+        return cls(weights, bias, mean, scale, threshold), scores
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "features": FEATURE_NAMES,
+                    "weights": self.weights.tolist(),
+                    "bias": self.bias,
+                    "mean": self.mean.tolist(),
+                    "scale": self.scale.tolist(),
+                    "threshold": self.threshold,
+                },
+                f,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "WaterPrefilter":
+        with open(path) as f:
+            saved = json.load(f)
+        if saved["features"] != FEATURE_NAMES:
+            raise ValueError(f"{path} was trained on other features")
+        return cls(
+            saved["weights"],
+            saved["bias"],
+            saved["mean"],
+            saved["scale"],
+            saved["threshold"],
+        )
+
+
+def load_prefilter(path: Optional[str] = None) -> Optional[WaterPrefilter]:
+    # the trained prefilter, None when there is none and every image goes to
+    # the vision model
+    path = path or PREFILTER_PATH
+    if not path or not os.path.exists(path):
+        return None
+    prefilter = WaterPrefilter.load(path)
+    if PREFILTER_THRESHOLD:
+        prefilter.threshold = float(PREFILTER_THRESHOLD)
+    return prefilter
+
+
+def evaluate(scores, labels, threshold: float) -> dict:
+    # recall on the flooded images and share of the images escalated
+    escalated = np.asarray(scores) >= threshold
+    labels = np.asarray(labels, dtype=bool)
+    return {
+        "images": int(len(labels)),
+        "flooded": int(labels.sum()),
+        "recall": float(escalated[labels].mean()) if labels.any() else 1.0,
+        "escalated": float(escalated.mean()) if len(labels) else 0.0,
+    }
+
+
+def cross_validate(features, labels, groups, recall=0.98, folds=5, seed=0) -> dict:
+    # evaluate over the cameras left out of training: each fold is scored
+    # against the threshold of the prefilter fit on the other cameras, so the
+    # recall is the one expected on cameras the prefilter never saw
+    features = np.asarray(features, dtype=np.float32)
+    labels = np.asarray(labels, dtype=bool)
+    groups = np.asarray(groups)
+    margins = np.zeros(len(labels))
+    for fold in group_folds(groups, folds, seed):
+        train = np.setdiff1d(np.arange(len(labels)), fold)
+        prefilter, _ = WaterPrefilter.fit(
+            features[train], labels[train], recall, folds, seed, groups[train]
+        )
+        margins[fold] = prefilter.score_features(features[fold]) - prefilter.threshold
+    return evaluate(margins, labels, 0.0)
+
+
+def main():
+    from utils.batch import create_session, list_images, read_image
+    from utils.change import camera_of
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("source", help="CSV, directory or file with one URL a line")
+    parser.add_argument("--recall", type=float, default=0.98)
+    parser.add_argument("--output", default=PREFILTER_PATH)
+    args = parser.parse_args()
+
+    session = create_session(4)
+    features, labels, groups = [], [], []
+    for image in list_images(args.source):
+        label = label_of(image)
+        if label is None:
+            continue
+        try:
+            features.append(water_features(read_image(image, session, 60)))
+        except Exception as exc:
+            print(f"skipped {image}: {exc!r}")
+            continue
+        labels.append(label)
+        groups.append(camera_of(image))
+    if not labels:
+        raise SystemExit(f"no labeled snapshots could be read from {args.source}")
+
+    result = cross_validate(features, labels, groups, args.recall)
+    print(
+        f"{result['images']} images of {len(set(groups))} cameras,"
+        f" {result['flooded']} flooded: on the cameras left out the prefilter"
+        f" kept {result['recall']:.1%} of the flooded ones and sent"
+        f" {result['escalated']:.1%} of the images to the model"
+    )
+    if result["recall"] < args.recall:
+        raise SystemExit(
+            f"recall under {args.recall:.1%} on the cameras left out,"
+            f" {args.output} not saved"
+        )
+    prefilter, _ = WaterPrefilter.fit(features, labels, args.recall, groups=groups)
+    prefilter.save(args.output)
+    print(f"threshold {prefilter.threshold:.3f}, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
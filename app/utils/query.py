@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+
+class QueryIndex:
+    """
+    Row positions of the treated identifications grouped by (object, label)
+    and by camera id, so the filters and the camera details only touch the
+    rows they return instead of scanning the whole frame.
+    """
+
+    def __init__(self, frame) -> None:
+        self.frame = frame
+        self.by_object_label = frame.groupby(
+            ["object", "label"], observed=True, sort=False
+        ).indices
+        self.by_camera = frame.groupby("id", observed=True, sort=False).indices
+
+        # labels of each object in the order they first appear in the frame
+        first_positions = {}
+        for (object_, label), positions in self.by_object_label.items():
+            first_positions.setdefault(object_, []).append((positions[0], label))
+        self.objects_labels = {
+            object_: [label for _, label in sorted(labels)]
+            for object_, labels in first_positions.items()
+        }
+        self.objects = sorted(frame["object"].dropna().unique().tolist())
+
+    def labels(self, object_):
+        return list(self.objects_labels.get(object_, []))
+
+    def positions(self, object_, labels):
+        positions = [
+            self.by_object_label[(object_, label)]
+            for label in labels
+            if (object_, label) in self.by_object_label
+        ]
+        if not positions:
+            return np.array([], dtype=np.intp)
+        # in frame order, as a boolean mask would return them
+        return np.sort(np.concatenate(positions))
+
+    def filter(self, object_, labels):
+        return self.frame.iloc[self.positions(object_, labels)]
+
+    def camera(self, camera_id):
+        positions = self.by_camera.get(camera_id, np.array([], dtype=np.intp))
+        return self.frame.iloc[positions]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresher:
+    """
+    Keeps the last good result of fetch and fetches it again in background
+    every interval seconds. Readers get the current snapshot without waiting
+    and concurrent refreshes share the same in-flight fetch.
+    """
+
+    def __init__(self, fetch, interval: float, snapshot=None, fetched_at=None):
+        self._fetch = fetch
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._snapshot = snapshot
+        self._fetched_at = fetched_at
+        self._attempted_at = None
+        self._inflight = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_error = None
+
+    @property
+    def fetched_at(self):
+        return self._fetched_at
+
+    def age(self):
+        # seconds since the data being served was fetched
+        if self._fetched_at is None:
+            return None
+        return time.time() - self._fetched_at
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def get(self):
+        self.start()
+        if self._fetched_at is None:
+            # nothing to serve yet, wait for the first fetch
+            return self.refresh().result()
+        return self._snapshot
+
+    def refresh(self) -> Future:
+        with self._lock:
+            if self._inflight is None:
+                self._inflight = Future()
+                threading.Thread(
+                    target=self._refresh, args=(self._inflight,), daemon=True
+                ).start()
+            return self._inflight
+
+    def _refresh(self, future: Future) -> None:
+        started_at = self._attempted_at = time.time()
+        try:
+            snapshot = self._fetch()
+        except Exception as exc:
+            logger.warning("Refresh failed, serving the last snapshot: %r", exc)
+            with self._lock:
+                self.last_error = exc
+                self._inflight = None
+            future.set_exception(exc)
+            return
+
+        # readers see either the previous snapshot or this one, never a mix
+        with self._lock:
+            self._snapshot, self._fetched_at = snapshot, started_at
+            self.last_error = None
+            self._inflight = None
+        future.set_result(snapshot)
+
+    def _next_delay(self) -> float:
+        # a failed fetch is retried on the next interval as well
+        last = max(self._fetched_at or 0, self._attempted_at or 0)
+        return max(0.0, last + self.interval - time.time())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._next_delay()):
+            try:
+                self.refresh().result()
+            except Exception:
+                pass
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+CAMERAS_FILE = "cameras.arrow"
+IDENTIFICATIONS_FILE = "identifications.arrow"
+
+
+def _ordered_type(arrow_type, values):
+    # pyarrow sorts the fields of inferred structs by name. Put them back in
+    # the order the keys come in the payload so the data reads back the same
+    if pa.types.is_struct(arrow_type):
+        records = [value for value in values if isinstance(value, dict)]
+        names = list(dict.fromkeys(key for record in records for key in record))
+        return pa.struct(
+            [
+                pa.field(
+                    name,
+                    _ordered_type(
+                        arrow_type.field(name).type,
+                        [record[name] for record in records if name in record],
+                    ),
+                )
+                for name in names
+            ]
+        )
+    if pa.types.is_list(arrow_type):
+        items = [item for value in values if value for item in value]
+        return pa.list_(_ordered_type(arrow_type.value_type, items))
+    return arrow_type
+
+
+def records_to_table(records):
+    table = pa.Table.from_pylist(records)
+    schema = _ordered_type(pa.struct(list(table.schema)), records)
+    return pa.Table.from_pylist(records, schema=pa.schema(list(schema)))
+
+
+def write_records(path, records, compression="uncompressed"):
+    feather.write_feather(records_to_table(records), path, compression=compression)
+
+
+def read_records(path):
+    return read_table(path).to_pylist()
+
+
+def read_table(path):
+    # memory mapped, uncompressed files are read without copying the buffers
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+class SnapshotStore:
+    """
+    On-disk store of fetched camera payloads and their treated
+    identifications, one directory per fetch named after the fetch time. A
+    version only becomes visible once all its files are written, so the
+    latest version is always a complete dataset.
+    """
+
+    def __init__(self, root: str, keep: int = 3) -> None:
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    def versions(self):
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def latest_version(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    @staticmethod
+    def fetched_at(version: str) -> float:
+        return (
+            datetime.strptime(version, "%Y%m%dT%H%M%S%fZ")
+            .replace(tzinfo=timezone.utc)
+            .timestamp()
+        )
+
+    def save(self, cameras, identifications=None, fetched_at=None) -> str:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        version = datetime.fromtimestamp(fetched_at, timezone.utc).strftime(
+            "%Y%m%dT%H%M%S%fZ"
+        )
+        tmp_path = os.path.join(self.root, f".{version}")
+        os.makedirs(tmp_path, exist_ok=True)
+        write_records(os.path.join(tmp_path, CAMERAS_FILE), cameras)
+        if identifications is not None:
+            feather.write_feather(
+                pa.Table.from_pandas(identifications),
+                os.path.join(tmp_path, IDENTIFICATIONS_FILE),
+                compression="uncompressed",
+            )
+        os.replace(tmp_path, os.path.join(self.root, version))
+        self._prune()
+        return version
+
+    def _prune(self) -> None:
+        for version in self.versions()[: -self.keep]:
+            shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+
+    def load_cameras(self, version=None):
+        version = version or self.latest_version()
+        if version is None:
+            return None
+        return read_records(os.path.join(self.root, version, CAMERAS_FILE))
+
+    def load_identifications(self, version=None):
+        version = version or self.latest_version()
+        if version is None:
+            return None
+        path = os.path.join(self.root, version, IDENTIFICATIONS_FILE)
+        if not os.path.exists(path):
+            return None
+        return read_table(path).to_pandas()
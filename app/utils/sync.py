@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+import pandas as pd
+from utils.metrics import timed
+from utils.taxonomy import current_taxonomy
+from utils.treat import (
+    IDENTIFICATION_COLUMNS,
+    SNAPSHOT_COLUMNS,
+    compact_identifications,
+    filter_identifications,
+    flatten_identifications,
+    translate_identifications,
+    treat_data,
+)
+
+# helper columns kept next to the treated rows so the full ordering of
+# treat_data can be rebuilt without treating the unchanged cameras again
+SORT_COLUMNS = ["_object", "order", "timestamp", "_camera_position", "_position"]
+SORT_ASCENDING = [True, True, False, True, True]
+# camera attributes read by treat_data, the rest come from cameras_aux.csv
+CAMERA_KEYS = ["id", "name", "latitude", "longitude"]
+IDENTIFICATION_KEYS = list(IDENTIFICATION_COLUMNS.values())
+SNAPSHOT_KEYS = list(SNAPSHOT_COLUMNS.values())
+# under this many cameras with identifications patching the treated rows
+# costs more than treating all of them again
+DELTA_MIN_CAMERAS = 3000
+
+
+def camera_fingerprint(camera):
+    # hash of the camera attributes and of every field treat_data reads from
+    # its identifications and their snapshots, in their order
+    values = list(map(camera.get, CAMERA_KEYS))
+    for identification in camera["identifications"]:
+        values += map(identification.get, IDENTIFICATION_KEYS)
+        values += map((identification.get("snapshot") or {}).get, SNAPSHOT_KEYS)
+    return hash(tuple(values))
+
+
+def concat_rows(rows, new_rows):
+    # column by column: pd.concat checks every value of the object columns
+    # that are all missing in one of the frames
+    return pd.DataFrame(
+        {
+            column: pd.concat([rows[column], new_rows[column]], ignore_index=True)
+            for column in rows.columns
+        }
+    )
+
+
+class CameraSync:
+    """
+    Keeps the treated identifications of the last refresh and, on each new
+    response, re-treats only the cameras whose identifications changed. The
+    returned frame is the same as treat_data(response). Fleets under
+    min_delta_cameras are treated in full when anything changed.
+    """
+
+    def __init__(self, min_delta_cameras: int = DELTA_MIN_CAMERAS) -> None:
+        self.min_delta_cameras = min_delta_cameras
+        self._lock = threading.Lock()
+        self._fingerprints = None
+        self._rows = None
+        self._result = (None, None)
+        self._taxonomy = None
+        self.version = 0
+        self.last_changes = {"changed": 0, "removed": 0, "unchanged": 0}
+
+    @timed("sync_identifications")
+    def update(self, response, taxonomy=None):
+        taxonomy = taxonomy or current_taxonomy()
+        with self._lock:
+            if self._taxonomy is None or self._taxonomy.version != taxonomy.version:
+                # translations and orders changed, every camera is treated again
+                self._fingerprints, self._rows = None, None
+                self._result = (None, None)
+                self._taxonomy = taxonomy
+            return self._update(response)
+
+    def _rebuild(self, response, fingerprints, n_cameras):
+        # treat_data over the whole response. The rows to patch are not kept,
+        # the next delta starts from all the cameras
+        self._fingerprints, self._rows = fingerprints, None
+        self.last_changes = {"changed": n_cameras, "removed": 0, "unchanged": 0}
+        self.version += 1
+        self._result = treat_data(response, taxonomy=self._taxonomy)
+        return self._result
+
+    def _update(self, response):
+        cameras = [camera for camera in response if camera.get("identifications")]
+        camera_ids = pd.Index([camera.get("id") for camera in cameras])
+        if camera_ids.has_duplicates:
+            # repeated camera ids can't be patched by id, treat all of them and
+            # start over on the next response
+            return self._rebuild(response, None, len(cameras))
+
+        fingerprints = pd.Series(
+            [camera_fingerprint(camera) for camera in cameras],
+            index=camera_ids,
+            dtype=np.int64,
+        )
+        changed_mask = np.ones(len(cameras), dtype=bool)
+        removed = set()
+        if self._fingerprints is not None:
+            positions = self._fingerprints.index.get_indexer(camera_ids)
+            known = positions >= 0
+            changed_mask[known] = (
+                self._fingerprints.to_numpy()[positions[known]]
+                != fingerprints.to_numpy()[known]
+            )
+            removed = set(
+                self._fingerprints.index[~self._fingerprints.index.isin(camera_ids)]
+            )
+            if not changed_mask.any() and not removed:
+                self.last_changes = {
+                    "changed": 0,
+                    "removed": 0,
+                    "unchanged": len(cameras),
+                }
+                return self._result
+        if len(cameras) < self.min_delta_cameras:
+            return self._rebuild(response, fingerprints, len(cameras))
+        if self._rows is None:
+            # the last result came from treat_data, every camera is treated
+            changed_mask[:] = True
+            removed = set()
+
+        changed = [
+            camera for camera, is_changed in zip(cameras, changed_mask) if is_changed
+        ]
+        self.last_changes = {
+            "changed": len(changed),
+            "removed": len(removed),
+            "unchanged": len(cameras) - len(changed),
+        }
+        rows = self._rows
+        stale = removed | {camera.get("id") for camera in changed}
+        if rows is not None and stale:
+            rows = rows[~rows["id"].isin(stale)]
+        new_rows = self._treat_rows(changed)
+        if new_rows is not None:
+            rows = new_rows if rows is None else concat_rows(rows, new_rows)
+
+        self._fingerprints = fingerprints
+        self._rows = rows
+        self.version += 1
+        self._result = self._assemble(cameras)
+        return self._result
+
+    def _treat_rows(self, cameras):
+        rows = flatten_identifications(cameras)
+        if rows is None:
+            return None
+        # position of each identification inside its camera, as exploded
+        rows["_position"] = rows.groupby(level=0).cumcount()
+        rows = filter_identifications(rows, taxonomy=self._taxonomy)
+        return translate_identifications(
+            rows.assign(_object=rows["object"]), taxonomy=self._taxonomy
+        )
+
+    def _assemble(self, cameras):
+        if not cameras or self._rows is None:
+            return None, None
+        positions = {camera.get("id"): i for i, camera in enumerate(cameras)}
+        rows = self._rows.assign(_camera_position=self._rows["id"].map(positions))
+
+        # same order as the two sorts in treat_data: by object and label
+        # order, then newest first, then the order the rows were exploded in
+        rows = rows.sort_values(SORT_COLUMNS, ascending=SORT_ASCENDING)
+        result = rows.drop(columns=["_object", "_position", "_camera_position"])
+        result.index = pd.Index(rows["_camera_position"].to_numpy())
+        return compact_identifications(result, taxonomy=self._taxonomy)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import threading
+
+# local overrides applied on top of the /objects catalog
+
+TRADUTOR = {
+    "image_corrupted": "imagem corrompida",
+    "image_description": "descrição da imagem",
+    "rain": "chuva",
+    "water_level": "nível da água",
+    "traffic": "tráfego",
+    "road_blockade": "bloqueio de estrada",
+    "false": "falso",
+    "true": "verdadeiro",
+    "null": "nulo",
+    "low": "baixo",
+    "medium": "médio",
+    "high": "alto",
+    "easy": "fácil",
+    "moderate": "moderado",
+    "difficult": "difícil",
+    "impossible": "impossível",
+    "free": "livre",
+    "partially": "parcialmente",
+    "totally": "totalmente",
+}
+
+# dict with the order of the labels from the worst to the best
+LABELS_ORDER = {
+    "road_blockade": [
+        "totally",
+        "partially",
+        "free",
+    ],
+    "traffic": [
+        "impossible",
+        "difficult",
+        "moderate",
+        "easy",
+    ],
+    "rain": [
+        "true",
+        "false",
+    ],
+    "water_level": [
+        "high",
+        "medium",
+        "low",
+    ],
+    "image_corrupted": [
+        "true",
+        "false",
+    ],
+}
+
+# colors of the labels, the first color that has a label wins
+LABELS_COLORS = {
+    "red": [
+        "major",
+        "totally_blocked",
+        "impossible",
+        "impossibe",
+        "poor",
+        "true",
+        "flodding",
+        "high",
+        "totally",
+    ],
+    "orange": [
+        "minor",
+        "partially_blocked",
+        "difficult",
+        "puddle",
+        "medium",
+        "moderate",
+        "partially",
+    ],
+    "green": [
+        "normal",
+        "free",
+        "easy",
+        "clean",
+        "false",
+        "low_indifferent",
+        "low",
+    ],
+}
+DEFAULT_COLOR = "grey"
+EMOJIS = {"red": "🔴", "orange": "🟠", "green": "🟢", "grey": "⚫"}
+
+# order of objects or labels missing from the taxonomy
+DEFAULT_ORDER = 99
+
+
+def content_hash(objects) -> str:
+    payload = json.dumps(objects, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Taxonomy:
+    """
+    Objects and labels of the /objects catalog with their translation,
+    severity order and color, compiled into dicts for O(1) lookups.
+    """
+
+    def __init__(self, objects=None, version=None) -> None:
+        objects = objects or []
+        self.version = version or content_hash(objects)
+
+        # labels from the worst to the best. Catalog labels without a local
+        # order go after the known ones, in catalog order
+        self.labels_order = {
+            name: list(labels) for name, labels in LABELS_ORDER.items()
+        }
+        self.translations = dict(TRADUTOR)
+        for object_ in objects:
+            name = object_.get("name")
+            values = [label.get("value") for label in object_.get("labels") or []]
+            order = self.labels_order.setdefault(name, [])
+            order.extend(v for v in values if v not in order and v != "null")
+            for value in [name, *values]:
+                self.translations.setdefault(value, value)
+
+        self.ranks = {
+            (name, label): rank
+            for name, labels in self.labels_order.items()
+            for rank, label in enumerate(labels)
+        }
+        # colors are looked up by translated label, as shown in the app
+        self.colors = {}
+        for color, labels in reversed(LABELS_COLORS.items()):
+            for label in labels:
+                if label in self.translations:
+                    self.colors[self.translations[label]] = color
+
+        # translated objects in the order the frame is sorted by (their names)
+        # and translated labels from the worst to the best within each object
+        self.objects_categories = list(
+            dict.fromkeys(self.translate(name) for name in sorted(self.labels_order))
+        )
+        self.labels_categories = list(
+            dict.fromkeys(
+                self.translate(label)
+                for labels in self.labels_order.values()
+                for label in labels
+            )
+        )
+
+    def translate(self, value):
+        return self.translations.get(value)
+
+    def rank(self, object_name, label) -> int:
+        return self.ranks.get((object_name, label), DEFAULT_ORDER)
+
+    def color(self, label) -> str:
+        return self.colors.get(label, DEFAULT_COLOR)
+
+    def emoji(self, label) -> str:
+        return EMOJIS[self.color(label)]
+
+
+_lock = threading.Lock()
+_taxonomies = {}
+_current = None
+
+
+def load_taxonomy(objects=None) -> Taxonomy:
+    # returns the compiled taxonomy of this catalog, compiling it only when
+    # the content of the catalog changes, and makes it the current one
+    global _current
+    version = content_hash(objects or [])
+    with _lock:
+        taxonomy = _taxonomies.get(version)
+        if taxonomy is None:
+            taxonomy = Taxonomy(objects, version=version)
+            # the previous catalogs won't come back, keep only the default one
+            default = Taxonomy()
+            _taxonomies.clear()
+            _taxonomies.update({default.version: default, version: taxonomy})
+        _current = taxonomy
+    return taxonomy
+
+
+def current_taxonomy() -> Taxonomy:
+    return _current or load_taxonomy()
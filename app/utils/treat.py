@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from utils.metrics import timed
+from utils.taxonomy import DEFAULT_ORDER, TRADUTOR, current_taxonomy  # noqa
+
+# output column -> key of the identification (or of its snapshot)
+IDENTIFICATION_COLUMNS = {
+    "object_id": "id",
+    "object": "object",
+    "title": "title",
+    "explanation": "explanation",
+    "timestamp": "timestamp",
+    "label": "label",
+    "label_explanation": "label_explanation",
+}
+SNAPSHOT_COLUMNS = {
+    "snapshot_id": "id",
+    "snapshot_camera_id": "camera_id",
+    "snapshot_url": "image_url",
+    "snapshot_timestamp": "timestamp",
+}
+TIMEZONE = "America/Sao_Paulo"
+
+# repeated strings stored once per distinct value (camera attributes once per
+# camera, snapshot fields once per snapshot)
+DICTIONARY_COLUMNS = [
+    "id",
+    "bairro",
+    "subprefeitura",
+    "name",
+    "label_explanation",
+    "snapshot_id",
+    "snapshot_camera_id",
+    "snapshot_url",
+]
+
+
+@lru_cache(maxsize=1)
+def load_cameras_aux():
+    cameras_aux = pd.read_csv("./data/database/cameras_aux.csv", dtype=str)
+    return cameras_aux.rename(columns={"id_camera": "camera_id"}).set_index("camera_id")
+
+
+def flatten_identifications(response):
+    # one row per identification with the camera attributes, indexed by the
+    # position of the camera among the cameras that have identifications.
+    # Columns are built straight from the payload; everything after that works
+    # on whole columns
+    cameras = [camera for camera in response if camera.get("identifications")]
+    if len(cameras) == 0:
+        return None
+
+    # the identifications and snapshots in payload order; each column below is
+    # gathered from these lists, with no intermediate frames
+    identifications = [
+        identification
+        for camera in cameras
+        for identification in camera["identifications"]
+    ]
+    snapshots = [
+        identification.get("snapshot") or {} for identification in identifications
+    ]
+    counts = np.fromiter(
+        (len(camera["identifications"]) for camera in cameras),
+        dtype=np.int64,
+        count=len(cameras),
+    )
+
+    camera_ids = pd.Series([camera.get("id") for camera in cameras], dtype=object)
+    cameras_aux = load_cameras_aux()
+    camera_columns = {
+        "id": camera_ids.to_numpy(),
+        "bairro": camera_ids.map(cameras_aux["bairro"]).to_numpy(),
+        "subprefeitura": camera_ids.map(cameras_aux["subprefeitura"]).to_numpy(),
+        "name": np.array([camera.get("name") for camera in cameras], dtype=object),
+        "latitude": np.array(
+            [camera.get("latitude") for camera in cameras], dtype=float
+        ),
+        "longitude": np.array(
+            [camera.get("longitude") for camera in cameras], dtype=float
+        ),
+    }
+
+    # camera attributes are repeated once per identification
+    columns = {
+        column: np.repeat(values, counts) for column, values in camera_columns.items()
+    }
+    for column, key in IDENTIFICATION_COLUMNS.items():
+        columns[column] = np.array(
+            [identification.get(key) for identification in identifications],
+            dtype=object,
+        )
+    for column, key in SNAPSHOT_COLUMNS.items():
+        columns[column] = np.array(
+            [snapshot.get(key) for snapshot in snapshots], dtype=object
+        )
+
+    for column in ["timestamp", "snapshot_timestamp"]:
+        columns[column] = pd.to_datetime(columns[column], format="ISO8601").tz_convert(
+            TIMEZONE
+        )
+
+    index = pd.Index(np.repeat(np.arange(len(cameras)), counts))
+    return pd.DataFrame(columns, index=index)
+
+
+def filter_identifications(cameras_identifications_explode, taxonomy=None):
+    # remove "image_description" from the objects and "null" from the labels
+    mask = (cameras_identifications_explode["object"] != "image_description") & (
+        cameras_identifications_explode["label"] != "null"
+    )
+    cameras_identifications_explode = cameras_identifications_explode[mask]
+
+    # # create a column order to sort the labels
+    return create_order_column(cameras_identifications_explode, taxonomy=taxonomy)
+
+
+def translate_identifications(cameras_identifications_explode, taxonomy=None):
+    # translate the labels of the columns object and label to portuguese
+    translations = (taxonomy or current_taxonomy()).translations
+    return cameras_identifications_explode.assign(
+        object=cameras_identifications_explode["object"].map(translations),
+        label=cameras_identifications_explode["label"].map(translations),
+    )
+
+
+def sort_identifications(cameras_identifications_explode):
+    # by object, then by the order of the labels and the newest first. The
+    # sort is stable, so ties keep the order the payload came in
+    return cameras_identifications_explode.sort_values(
+        ["object", "order", "timestamp"], ascending=[True, True, False]
+    )
+
+
+def ordered_categorical(values, categories):
+    # values missing from categories go after them, in alphabetical order
+    extra = sorted(set(values.dropna().unique()) - set(categories))
+    return pd.Categorical(values, categories=categories + extra, ordered=True)
+
+
+def compact_identifications(cameras_identifications_explode, taxonomy=None):
+    # object and label as ordered categoricals, so sorting by them follows the
+    # object order and the severity of the labels, and the repeated strings
+    # dictionary-encoded
+    taxonomy = taxonomy or current_taxonomy()
+    columns = {
+        "object": ordered_categorical(
+            cameras_identifications_explode["object"], taxonomy.objects_categories
+        ),
+        "label": ordered_categorical(
+            cameras_identifications_explode["label"], taxonomy.labels_categories
+        ),
+        "order": cameras_identifications_explode["order"].astype(np.int8),
+    }
+    for column in DICTIONARY_COLUMNS:
+        columns[column] = cameras_identifications_explode[column].astype("category")
+    return cameras_identifications_explode.assign(**columns)
+
+
+@timed("treat_data")
+def treat_data(response, taxonomy=None):
+    taxonomy = taxonomy or current_taxonomy()
+    cameras_identifications_explode = flatten_identifications(response)
+    if cameras_identifications_explode is None:
+        return None, None
+
+    cameras_identifications_explode = filter_identifications(
+        cameras_identifications_explode, taxonomy=taxonomy
+    )
+    cameras_identifications_explode = sort_identifications(
+        cameras_identifications_explode
+    )
+    cameras_identifications_explode = translate_identifications(
+        cameras_identifications_explode, taxonomy=taxonomy
+    )
+    return compact_identifications(cameras_identifications_explode, taxonomy=taxonomy)
+
+
+def explode_df(dataframe, column_to_explode, prefix=None):
+    df = dataframe.copy()
+    exploded_df = df.explode(column_to_explode)
+    new_df = pd.json_normalize(exploded_df[column_to_explode])
+
+    if prefix:
+        new_df = new_df.add_prefix(f"{prefix}_")
+
+    df.drop(columns=column_to_explode, inplace=True)
+    new_df.index = exploded_df.index
+    result_df = df.join(new_df)
+
+    return result_df
+
+
+def create_order_column(table, taxonomy=None):
+    # create a column order with the severity rank of the label in its object
+    # (from the worst to the best). The lookup is done on the distinct
+    # objects and labels and then gathered by their codes
+    taxonomy = taxonomy or current_taxonomy()
+    object_codes, objects = pd.factorize(table["object"])
+    label_codes, labels = pd.factorize(table["label"])
+    lookup = np.full((len(objects) + 1, len(labels) + 1), DEFAULT_ORDER, np.int64)
+    for i, object_name in enumerate(objects):
+        for j, label in enumerate(labels):
+            lookup[i, j] = taxonomy.rank(object_name, label)
+
+    # code -1 (missing values) falls in the last row/column of the lookup
+    return table.assign(order=lookup[object_codes, label_codes])
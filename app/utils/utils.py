@@ -1,40 +1,92 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import hashlib
 import json  # noqa
+import logging
+import math
 import os  # noqa
+import time
 from typing import Union
 
-import folium
 import pandas as pd
 import streamlit as st
 from st_aggrid import GridOptionsBuilder  # noqa
 from st_aggrid import GridUpdateMode  # noqa
 from st_aggrid import AgGrid, ColumnsAutoSizeMode  # noqa
-from utils.api import APIVisionAI
-
-TRADUTOR = {
-    "image_corrupted": "imagem corrompida",
-    "image_description": "descrição da imagem",
-    "rain": "chuva",
-    "water_level": "nível da água",
-    "traffic": "tráfego",
-    "road_blockade": "bloqueio de estrada",
-    "false": "falso",
-    "true": "verdadeiro",
-    "null": "nulo",
-    "low": "baixo",
-    "medium": "médio",
-    "high": "alto",
-    "easy": "fácil",
-    "moderate": "moderado",
-    "difficult": "difícil",
-    "impossible": "impossível",
-    "free": "livre",
-    "partially": "parcialmente",
-    "totally": "totalmente",
-}
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit_folium import st_folium
+from utils.api import APIVisionAI, AsyncAPIVisionAI
+from utils.auth import TOKEN_LIFETIME
+from utils.maps import add_camera_layer, add_camera_markers, base_map, map_fingerprint
+from utils.metrics import REGISTRY, ScriptRun, start_metrics_server, timed
+from utils.query import QueryIndex
+from utils.refresh import BackgroundRefresher
+from utils.store import SnapshotStore, read_records, write_records
+from utils.sync import CameraSync
+from utils.taxonomy import current_taxonomy, load_taxonomy
+from utils.treat import TRADUTOR, create_order_column, explode_df, treat_data  # noqa
+
+# display_map sends the rendered map to the component of st_folium itself,
+# with internals of streamlit-folium 0.15.1 as pinned in poetry.lock. Other
+# versions without them render the map with st_folium on every rerun
+try:
+    from streamlit_folium import (
+        _component_func,
+        _get_map_string,
+        _get_siblings,
+        generate_js_hash,
+        get_full_id,
+    )
+except ImportError:
+    _component_func = None
+
+logger = logging.getLogger(__name__)
+# the fetches and refreshes log to the output of the app, LOG_LEVEL=WARNING
+# leaves only the failures
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+ACTIVE_CAMERAS_PATH = "/agents/89173394-ee85-4613-8d2b-b0f860c26b0f/cameras"
+
+# cost of one extra request expressed in response bytes: besides its payload,
+# each request pays a round trip and headers, which on Cloud Run weighs about
+# as much as downloading 32 KB
+REQUEST_COST_BYTES = 32 * 1024
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.arrow"
+# the camera identifications are fetched again in background on this interval
+CAMERAS_REFRESH_INTERVAL = 60 * 2
+
+SNAPSHOT_STORE_PATH = os.environ.get("SNAPSHOT_STORE_PATH", "./data/store")
+# shows the metrics of the process in the sidebar of every page
+SHOW_METRICS_PANEL = os.environ.get("SHOW_METRICS_PANEL", "").lower() in ["1", "true"]
+
+
+def credentials_hash(username, password):
+    return hashlib.sha256(f"{username}\0{password}".encode("utf-8")).hexdigest()
+
+
+@st.cache_resource(ttl=TOKEN_LIFETIME, show_spinner=False)
+def get_api_client(credentials_hash, _username, _password):
+    # one authenticated client per credentials, shared by every session and
+    # rerun. Failed logins raise and are not cached
+    return APIVisionAI(username=_username, password=_password)
+
+
+# client of the last session that resolved one, used by background threads
+_shared_client = None
 
 
 def get_vision_ai_api():
+    global _shared_client
+    if get_script_run_ctx() is None:
+        # background refreshes have no session to log in with
+        if _shared_client is None:
+            raise RuntimeError("No logged in Vision AI client yet")
+        return _shared_client
+
     def user_is_logged_in():
         if "logged_in" not in st.session_state:
             st.session_state["logged_in"] = False
@@ -43,10 +95,10 @@ def get_vision_ai_api():
             username = st.session_state["username"]
             password = st.session_state["password"]
             try:
-                _ = APIVisionAI(
-                    username=username,
-                    password=password,
-                )
+                # validates the credentials and keeps the client for the session
+                get_api_client(credentials_hash(username, password), username, password)
+                # the login widgets and their keys are gone after this rerun
+                st.session_state["credentials"] = (username, password)
                 st.session_state["logged_in"] = True
             except Exception as exc:
                 st.error(f"Error: {exc}")
@@ -64,212 +116,297 @@ def get_vision_ai_api():
     if not user_is_logged_in():
         st.stop()
 
-    vision_api = APIVisionAI(
-        username=st.session_state["username"],
-        password=st.session_state["password"],
+    username, password = st.session_state["credentials"]
+    _shared_client = get_api_client(
+        credentials_hash(username, password), username, password
+    )
+    return _shared_client
+
+
+def plan_cameras_fetch(n_active, n_total, camera_bytes, page_size=3000):
+    # pick the cheapest way to get the active cameras. "bulk" pages through
+    # every camera and filters by the active ids on the client, "targeted"
+    # issues one GET per active camera. Without the number of cameras or
+    # their size, as on the first fetch, it is "bulk", which learns both
+    if not n_total or not camera_bytes:
+        return {"strategy": "bulk", "estimated_requests": None, "estimated_bytes": None}
+    strategies = {
+        "bulk": (math.ceil(n_total / page_size), n_total * camera_bytes),
+        "targeted": (n_active, n_active * camera_bytes),
+    }
+    costs = {
+        strategy: n_requests * REQUEST_COST_BYTES + n_bytes
+        for strategy, (n_requests, n_bytes) in strategies.items()
+    }
+    strategy = min(costs, key=costs.get)
+    n_requests, n_bytes = strategies[strategy]
+    return {
+        "strategy": strategy,
+        "estimated_requests": n_requests,
+        "estimated_bytes": round(n_bytes),
+    }
+
+
+def plan_active_cameras(api, cameras_ativas, page_size=None):
+    # the fetch report, the arguments of the get_all_pages call and the ids
+    # to keep, shared by get_cameras and get_cameras_async. The number of
+    # cameras and their average size come from the /cameras pages fetched
+    # before, a single camera can be far from the average
+    active_ids = list(dict.fromkeys(d.get("id") for d in cameras_ativas))
+    n_total = api.tuner.total("/cameras")
+    camera_bytes = api.tuner.item_bytes("/cameras")
+    page_size, _ = api._plan_pages("/cameras", page_size, n_total)
+    report = plan_cameras_fetch(
+        len(active_ids), n_total, camera_bytes, page_size=page_size
     )
-    return vision_api
+    if report["strategy"] == "bulk":
+        fetch = {"path": "/cameras", "page_size": page_size}
+    else:
+        fetch = {"path": [f"/cameras/{camera_id}" for camera_id in active_ids]}
+    return report, fetch, set(active_ids)
 
 
-vision_api = get_vision_ai_api()
-# vision_api = APIVisionAI(
-#     username=os.environ.get("VISION_API_USERNAME"),
-#     password=os.environ.get("VISION_API_PASSWORD"),
-# )
+def filter_active_cameras(data, active_ids):
+    return [camera for camera in data if camera.get("id") in active_ids]
 
 
 def get_cameras(
     only_active=True,
     use_mock_data=False,
     update_mock_data=False,
-    page_size=3000,
+    page_size=None,
     timeout=120,
+    return_report=False,
+    partial=False,
 ):
-    mock_data_path = "./data/temp/mock_api_data.json"
-
+    # with partial=True the cameras of pages that keep failing are left out
+    # and the pages are listed in the report's failed_pages. page_size=None
+    # lets the client pick it from the previous fetches
     if use_mock_data:
-        with open(mock_data_path) as f:
-            data = json.load(f)
-        return data
+        return read_records(MOCK_DATA_PATH)
+
+    vision_api = get_vision_ai_api()
+    stats = vision_api.new_stats()
     if only_active:
-        cameras_ativas = vision_api._get_all_pages(
-            "/agents/89173394-ee85-4613-8d2b-b0f860c26b0f/cameras"
+        cameras_ativas = vision_api._get_all_pages(ACTIVE_CAMERAS_PATH, stats=stats)
+        report, fetch, active_ids = plan_active_cameras(
+            vision_api, cameras_ativas, page_size
+        )
+        data = vision_api._get_all_pages(
+            **fetch, timeout=timeout, stats=stats, partial=partial
         )
-        cameras_ativas_ids = [f"/cameras/{d.get('id')}" for d in cameras_ativas]  # noqa
-        data = vision_api._get_all_pages(cameras_ativas_ids, timeout=timeout)
+        data = filter_active_cameras(data, active_ids)
     else:
+        report = {"strategy": "all"}
         data = vision_api._get_all_pages(
-            path="/cameras", page_size=page_size, timeout=timeout
+            path="/cameras",
+            page_size=page_size,
+            timeout=timeout,
+            stats=stats,
+            partial=partial,
         )
+    report.update(stats)
+    logger.info("Cameras fetch report: %s", report)
 
     if update_mock_data:
-        with open(mock_data_path, "w") as f:
-            json.dump(data, f)
+        write_records(MOCK_DATA_PATH, data, compression="zstd")
 
+    if return_report:
+        return data, report
     return data
 
 
 def get_objects(
-    page_size=100,
+    page_size=None,
     timeout=120,
 ):
-    data = vision_api._get_all_pages(
+    data = get_vision_ai_api()._get_all_pages(
         path="/objects", page_size=page_size, timeout=timeout
     )
     return data
 
 
 def get_prompts(
-    page_size=100,
+    page_size=None,
     timeout=120,
 ):
-    data = vision_api._get_all_pages(
+    data = get_vision_ai_api()._get_all_pages(
         path="/prompts", page_size=page_size, timeout=timeout
     )
     return data
 
 
-@st.cache_data(ttl=60 * 2, persist=False)
-def get_cameras_cache(
+async def get_cameras_async(
+    async_api: AsyncAPIVisionAI,
     only_active=True,
-    use_mock_data=False,
-    update_mock_data=False,
-    page_size=3000,
+    page_size=None,
+    timeout=120,
+):
+    stats = async_api.api.new_stats()
+    if only_active:
+        cameras_ativas = await async_api.get_all_pages(ACTIVE_CAMERAS_PATH, stats=stats)
+        report, fetch, active_ids = plan_active_cameras(
+            async_api.api, cameras_ativas, page_size
+        )
+        data = await async_api.get_all_pages(**fetch, timeout=timeout, stats=stats)
+        data = filter_active_cameras(data, active_ids)
+    else:
+        report = {"strategy": "all"}
+        data = await async_api.get_all_pages(
+            path="/cameras", page_size=page_size, timeout=timeout, stats=stats
+        )
+    report.update(stats)
+    logger.info("Cameras fetch report: %s", report)
+    return data
+
+
+async def get_catalog_async(
+    cameras=True,
+    objects=True,
+    prompts=True,
+    only_active=True,
+    cameras_page_size=None,
+    page_size=None,
     timeout=120,
 ):
-    return get_cameras(
-        only_active=only_active,
-        use_mock_data=use_mock_data,
-        update_mock_data=update_mock_data,
-        page_size=page_size,
-        timeout=timeout,
+    # run the catalog fetches concurrently on the same event loop
+    async with AsyncAPIVisionAI(get_vision_ai_api()) as async_api:
+        fetches = {}
+        if cameras:
+            fetches["cameras"] = get_cameras_async(
+                async_api,
+                only_active=only_active,
+                page_size=cameras_page_size,
+                timeout=timeout,
+            )
+        if objects:
+            fetches["objects"] = async_api.get_all_pages(
+                path="/objects", page_size=page_size, timeout=timeout
+            )
+        if prompts:
+            fetches["prompts"] = async_api.get_all_pages(
+                path="/prompts", page_size=page_size, timeout=timeout
+            )
+        results = await asyncio.gather(*fetches.values())
+    return dict(zip(fetches.keys(), results))
+
+
+def get_catalog(
+    cameras=True,
+    objects=True,
+    prompts=True,
+    only_active=True,
+    cameras_page_size=None,
+    page_size=None,
+    timeout=120,
+):
+    return asyncio.run(
+        get_catalog_async(
+            cameras=cameras,
+            objects=objects,
+            prompts=prompts,
+            only_active=only_active,
+            cameras_page_size=cameras_page_size,
+            page_size=page_size,
+            timeout=timeout,
+        )
     )
 
 
 @st.cache_data(ttl=60 * 2, persist=False)
-def get_objects_cache(page_size=100, timeout=120):
+def get_objects_cache(page_size=None, timeout=120):
     return get_objects(page_size=page_size, timeout=timeout)
 
 
 @st.cache_data(ttl=60 * 2, persist=False)
-def get_prompts_cache(page_size=100, timeout=120):
+def get_prompts_cache(page_size=None, timeout=120):
     return get_prompts(page_size=page_size, timeout=timeout)
 
 
-def treat_data(response):
-    cameras_aux = pd.read_csv("./data/database/cameras_aux.csv", dtype=str)
-
-    cameras_aux = cameras_aux.rename(columns={"id_camera": "camera_id"})
-    cameras = pd.DataFrame(response)
-    cameras = cameras.rename(columns={"id": "camera_id"})
-    cameras = cameras[cameras["identifications"].apply(lambda x: len(x) > 0)]
-    if len(cameras) == 0:
-        return None, None
-    cameras = cameras.merge(cameras_aux, on="camera_id", how="left")
-    # st.dataframe(cameras)
-
-    cameras_attr = cameras[
-        [
-            "camera_id",
-            "bairro",
-            "subprefeitura",
-            "name",
-            # "rtsp_url",
-            # "update_interval",
-            "latitude",
-            "longitude",
-            "identifications",
-            # "snapshot_url",
-            # "id_h3",
-            # "id_bolsao",
-            # "bolsao_latitude",
-            # "bolsao_longitude",
-            # "bolsao_classe_atual",
-            # "bacia",
-            # "sub_bacia",
-            # "geometry_bolsao_buffer_0.002",
-        ]
-    ]
+@st.cache_resource
+def get_camera_sync():
+    # shared by every session so a refresh that brings nothing new isn't
+    # treated again
+    return CameraSync()
 
-    cameras_identifications_explode = explode_df(
-        cameras_attr, "identifications"
-    )  # noqa
 
-    cameras_identifications_explode = cameras_identifications_explode.rename(
-        columns={"id": "object_id"}
-    ).rename(columns={"camera_id": "id"})
-    cameras_identifications_explode = cameras_identifications_explode.rename(
-        columns={
-            "snapshot.id": "snapshot_id",
-            "snapshot.camera_id": "snapshot_camera_id",
-            "snapshot.image_url": "snapshot_url",
-            "snapshot.timestamp": "snapshot_timestamp",
-        }
-    )
+def get_taxonomy():
+    # compiled again only when the content of the /objects catalog changes
+    try:
+        objects = get_objects_cache()
+    except Exception as exc:
+        logger.warning(
+            "Could not get the objects catalog, using the local taxonomy: %s", exc
+        )
+        return current_taxonomy()
+    return load_taxonomy(objects)
 
-    cameras_identifications_explode["timestamp"] = pd.to_datetime(
-        cameras_identifications_explode["timestamp"], format="ISO8601"
-    ).dt.tz_convert("America/Sao_Paulo")
 
-    cameras_identifications_explode["snapshot_timestamp"] = pd.to_datetime(
-        cameras_identifications_explode["snapshot_timestamp"], format="ISO8601"
-    ).dt.tz_convert("America/Sao_Paulo")
+def sync_cameras_identifications(response):
+    # same result as treat_data(response). The frame is shared between
+    # sessions and must not be modified in place
+    return get_camera_sync().update(response, taxonomy=get_taxonomy())
 
-    cameras_identifications_explode = (
-        cameras_identifications_explode.sort_values(  # noqa
-            ["timestamp", "label"], ascending=False
-        )
-    )
 
-    # remove "image_description" from the objects
-    cameras_identifications_explode = cameras_identifications_explode[
-        cameras_identifications_explode["object"] != "image_description"
-    ]
+@st.cache_resource
+def get_snapshot_store():
+    return SnapshotStore(SNAPSHOT_STORE_PATH)
 
-    # remove "null" from the labels
-    cameras_identifications_explode = cameras_identifications_explode[
-        cameras_identifications_explode["label"] != "null"
-    ]
 
-    # # create a column order to sort the labels
-    cameras_identifications_explode = create_order_column(
-        cameras_identifications_explode
-    )
-    # sort the table first by object then by the column order
-    cameras_identifications_explode = cameras_identifications_explode.sort_values(
-        ["object", "order"]
-    )
+@st.cache_resource
+def get_cameras_refresher(**kwargs):
+    # one per process and fetch arguments. A process that just started serves
+    # the last stored snapshot until its first fetch finishes
+    use_store = not kwargs.get("use_mock_data")
+    store = get_snapshot_store()
+    version = store.latest_version() if use_store else None
+    snapshot = store.load_identifications(version) if version else None
+    saved_version = None
 
-    # translate the labels of the columns object and label to portuguese using the dictionary above
-    cameras_identifications_explode["object"] = cameras_identifications_explode[
-        "object"
-    ].map(TRADUTOR)
-    cameras_identifications_explode["label"] = cameras_identifications_explode[
-        "label"
-    ].map(TRADUTOR)
+    def fetch_cameras_identifications():
+        nonlocal saved_version
+        fetched_at = time.time()
+        cameras = get_cameras(**kwargs)
+        identifications = sync_cameras_identifications(cameras)
 
-    # # print one random row of the dataframe in list format so I can see all the columns
-    # print(cameras_identifications_explode.sample(1).values.tolist())
+        # persist each new dataset so a restarted process can start from it
+        version = get_camera_sync().version
+        if use_store and version != saved_version:
+            saved_version = version
+            store.save(
+                cameras,
+                identifications if isinstance(identifications, pd.DataFrame) else None,
+                fetched_at=fetched_at,
+            )
+        return identifications
 
-    # # print all columns of cameras_identifications_explode
-    # print(cameras_identifications_explode.columns)
+    return BackgroundRefresher(
+        fetch_cameras_identifications,
+        interval=CAMERAS_REFRESH_INTERVAL,
+        snapshot=snapshot,
+        fetched_at=store.fetched_at(version) if snapshot is not None else None,
+    ).start()
 
-    return cameras_identifications_explode
 
+def get_cameras_identifications(bypass_cache=False, **kwargs):
+    # treated identifications of the cameras, see get_cameras for the kwargs.
+    # bypass_cache waits for a new fetch, shared with any fetch in flight
+    refresher = get_cameras_refresher(**kwargs)
+    if bypass_cache:
+        return refresher.refresh().result()
+    return refresher.get()
 
-def explode_df(dataframe, column_to_explode, prefix=None):
-    df = dataframe.copy()
-    exploded_df = df.explode(column_to_explode)
-    new_df = pd.json_normalize(exploded_df[column_to_explode])
 
-    if prefix:
-        new_df = new_df.add_prefix(f"{prefix}_")
+def get_cameras_identifications_age(**kwargs):
+    # seconds since the served identifications were fetched
+    return get_cameras_refresher(**kwargs).age()
 
-    df.drop(columns=column_to_explode, inplace=True)
-    new_df.index = exploded_df.index
-    result_df = df.join(new_df)
 
-    return result_df
+@st.cache_resource(max_entries=4, hash_funcs={pd.DataFrame: id})
+def get_query_index(cameras_identifications_df):
+    # built once per treated frame. The index keeps a reference to its frame,
+    # so the id of a cached frame can't be reused by a new one
+    return QueryIndex(cameras_identifications_df)
 
 
 def get_objetcs_labels_df(objects, keep_null=False):
@@ -287,14 +424,18 @@ def get_objetcs_labels_df(objects, keep_null=False):
 
 
 def get_filted_cameras_objects(
-    cameras_identifications_df, object_filter, label_filter
+    cameras_identifications_df, object_filter, label_filter, query_index=None
 ):  # noqa
     # filter both dfs by object and label
-
-    cameras_identifications_filter_df = cameras_identifications_df[
-        (cameras_identifications_df["object"] == object_filter)
-        & (cameras_identifications_df["label"].isin(label_filter))
-    ]
+    if query_index is not None:
+        cameras_identifications_filter_df = query_index.filter(
+            object_filter, label_filter
+        )
+    else:
+        cameras_identifications_filter_df = cameras_identifications_df[
+            (cameras_identifications_df["object"] == object_filter)
+            & (cameras_identifications_df["label"].isin(label_filter))
+        ]
 
     cameras_identifications_filter_df = (
         cameras_identifications_filter_df.sort_values(  # noqa
@@ -306,95 +447,74 @@ def get_filted_cameras_objects(
 
 
 def get_icon_color(label: Union[bool, None], type=None):
-    red = [
-        "major",
-        "totally_blocked",
-        "impossible",
-        "impossibe",
-        "poor",
-        "true",
-        "flodding",
-        "high",
-        "totally",
-    ]
-    orange = [
-        "minor",
-        "partially_blocked",
-        "difficult",
-        "puddle",
-        "medium",
-        "moderate",
-        "partially",
-    ]
+    taxonomy = current_taxonomy()
+    if type == "emoji":
+        return taxonomy.emoji(label)
+    return taxonomy.color(label)
+
+
+@timed("create_map")
+def create_map(chart_data, location=None, mode="layer", cluster=None):
+    # "layer" draws every camera as one GeoJSON layer, clustered when there are
+    # many points unless cluster is given; "markers" adds one marker per row
+    m = base_map(chart_data, location=location)
+    if mode == "markers":
+        return add_camera_markers(m, chart_data)
+    return add_camera_layer(m, chart_data, cluster=cluster)
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def render_map(fingerprint, _chart_data):
+    # what st_folium sends to the browser, rendered once per fingerprint and
+    # shared by the sessions
+    m = create_map(_chart_data)
+    m.render()
+    script = _get_map_string(m)
+    southwest, northeast = m.get_bounds()
+    return {
+        "script": script,
+        "html": _get_siblings(m),
+        "id": get_full_id(m),
+        "bounds": {
+            "_southWest": {"lat": southwest[0], "lng": southwest[1]},
+            "_northEast": {"lat": northeast[0], "lng": northeast[1]},
+        },
+    }
 
-    green = [
-        "normal",
-        "free",
-        "easy",
-        "clean",
-        "false",
-        "low_indifferent",
-        "low",
-    ]
-    if label in [TRADUTOR.get(label) for label in red]:  # noqa
-        if type == "emoji":
-            return "🔴"
-        return "red"
-
-    elif label in [TRADUTOR.get(label) for label in orange]:
-        if type == "emoji":
-            return "🟠"
-        return "orange"
-    elif label in [TRADUTOR.get(label) for label in green]:
-        if type == "emoji":
-            return "🟢"
-        return "green"
-    else:
-        if type == "emoji":
-            return "⚫"
-        return "grey"
-
-
-def create_map(chart_data, location=None):
-    chart_data = chart_data.fillna("")
-    # center map on the mean of the coordinates
-    if location is not None:
-        m = folium.Map(location=location, zoom_start=16)
-    elif len(chart_data) > 0:
-        m = folium.Map(
-            location=[
-                chart_data["latitude"].mean(),
-                chart_data["longitude"].mean(),
-            ],  # noqa
-            zoom_start=11,
+
+def display_map(chart_data, center=None, zoom=None, key=None, height=700):
+    # the same component as st_folium, but the map is only rendered again when
+    # the drawn rows change: each rerun sends the cached script with the
+    # center and zoom. Centering on a camera is a view change in the browser
+    # and map interactions don't rerun the app
+    if _component_func is None:
+        return st_folium(
+            create_map(chart_data),
+            key=key,
+            height=height,
+            width="100%",
+            returned_objects=[],
+            zoom=zoom,
+            center=center,
         )
-    else:
-        m = folium.Map(location=[-22.917690, -43.413861], zoom_start=11)
-
-    for _, row in chart_data.iterrows():
-        icon_color = get_icon_color(row["label"])
-        htmlcode = f"""<div>
-        <img src="{row["snapshot_url"]}" width="300" height="185">
-
-        <br /><span>ID: {row["id"]}<br>Label: {row["label"]}</span>
-        </div>
-        """
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            # Adicionar id_camera ao tooltip
-            tooltip=f"ID: {row['id']}<br>Label: {row['label']}",
-            # Alterar a cor do ícone de acordo com o status
-            popup=htmlcode,
-            icon=folium.features.DivIcon(
-                icon_size=(15, 15),
-                icon_anchor=(7, 7),
-                html=f'<div style="width: 15px; height: 15px; background-color: {icon_color}; border: 2px solid black; border-radius: 70%;"></div>',  # noqa
-            ),
-        ).add_to(m)
-    return m
-
-
-def display_camera_details(row, cameras_identifications_df):
+    rendered = render_map(map_fingerprint(chart_data), chart_data)
+    return _component_func(
+        script=rendered["script"],
+        html=rendered["html"],
+        id=rendered["id"],
+        key=generate_js_hash(rendered["script"], key, False),
+        height=height,
+        width="100%",
+        returned_objects=[],
+        default={},
+        zoom=zoom,
+        center=center,
+        feature_group=None,
+        return_on_hover=False,
+    )
+
+
+def display_camera_details(row, cameras_identifications_df, query_index=None):
     camera_id = row["id"]
     image_url = row["snapshot_url"]
     camera_name = row["name"]
@@ -414,9 +534,12 @@ def display_camera_details(row, cameras_identifications_df):
         )
 
     st.markdown("### 📃 Detalhes")
-    camera_identifications = cameras_identifications_df[
-        cameras_identifications_df["id"] == camera_id
-    ]  # noqa
+    if query_index is not None:
+        camera_identifications = query_index.camera(camera_id)
+    else:
+        camera_identifications = cameras_identifications_df[
+            cameras_identifications_df["id"] == camera_id
+        ]  # noqa
 
     # st.dataframe(camera_identifications)
 
@@ -505,6 +628,34 @@ def display_camera_details(row, cameras_identifications_df):
         i += 1
 
 
+def prepare_aggrid_table(cameras_identifications_filter_df):
+    selected_cols = [
+        "index",
+        "object",
+        "label",
+        "bairro",
+        "timestamp",
+        "id",
+    ]
+    aggrid_table = cameras_identifications_filter_df.copy()
+    # mapped once per label category, not per row
+    aggrid_table["index"] = aggrid_table["label"].map(
+        lambda label: get_icon_color(label=label, type="emoji")
+    )
+
+    # sort the table first by object then by the column order
+    aggrid_table = aggrid_table.sort_values(
+        by=["object", "order"], ascending=[True, True]
+    )
+
+    # capitalize the values of the columns object and label
+    aggrid_table["object"] = aggrid_table["object"].str.capitalize()
+    aggrid_table["label"] = aggrid_table["label"].str.capitalize()
+
+    return aggrid_table[selected_cols]
+
+
+@timed("display_agrid_table")
 def display_agrid_table(table):
     gb = GridOptionsBuilder.from_dataframe(table, index=True)  # noqa
 
@@ -556,42 +707,22 @@ def display_agrid_table(table):
     return selected_row
 
 
-def create_order_column(table):
-    # dict with the order of the labels from the worst to the best
-    order = {
-        "road_blockade": [
-            "totally",
-            "partially",
-            "free",
-        ],
-        "traffic": [
-            "impossible",
-            "difficult",
-            "moderate",
-            "easy",
-        ],
-        "rain": [
-            "true",
-            "false",
-        ],
-        "water_level": [
-            "high",
-            "medium",
-            "low",
-        ],
-        "image_corrupted": [
-            "true",
-            "false",
-        ],
-    }
+def start_script_run(page):
+    # serves the metrics of the process to Prometheus and times this run
+    start_metrics_server()
+    return ScriptRun(page)
 
-    # create a column order with the following rules:
-    # 1. if the object is not in the order keys dict, return 99
-    # 2. if the object is in the order keys, return the index of the label in the order list
 
-    # knowing that the dataframe always have the columns object and label, we can use the following code
-    table["order"] = table.apply(
-        lambda row: order.get(row["object"], 99).index(row["label"]), axis=1
-    )
+def end_script_run(script_run):
+    script_run.stop()
+    if SHOW_METRICS_PANEL:
+        display_metrics_panel()
+
 
-    return table
+def display_metrics_panel():
+    with st.sidebar.expander("📊 Métricas", expanded=False):
+        rows = REGISTRY.summary()
+        if not rows:
+            st.caption("Nenhuma métrica coletada ainda.")
+            return
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Batch classification against the local stand-in for OpenAI: the images of
+the mock classification CSV, served by the stand-in, classified one at a
+time as run_model does and with classify_batch. Then a run cut short
+mid-line is resumed, and the calls answered with a rate limit error are
+tried again by a second run.
+
+  python benchmarks/bench_batch_classify.py [--images N] [--latency SECONDS]
+      [--workers N] [--inflight N] [--sequential N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.model as model  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from utils.batch import (  # noqa: E402
+    classify_batch,
+    create_session,
+    list_images,
+    read_image,
+    read_results,
+)
+
+CSV_PATH = "./data/temp/mock_image_classification.csv"
+
+
+def read_labels(path):
+    # skips the line cut short, as a resumed run does
+    results = read_results(path).values()
+    return {result["image"]: result["label"] for result in results if "label" in result}
+
+
+def check(fake, images, labels):
+    assert set(labels) == set(images), f"{len(set(images) - set(labels))} missing"
+    wrong = [image for image in images if labels[image] != fake.expected_label(image)]
+    assert not wrong, f"{len(wrong)} wrong labels"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--images", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--inflight", type=int, default=8)
+    parser.add_argument("--sequential", type=int, default=30)
+    args = parser.parse_args()
+
+    n_images = args.images or len(list_images(CSV_PATH))
+    directory = tempfile.TemporaryDirectory()
+    with FakeOpenAI(args.latency, args.download_latency) as fake, directory:
+        model.OPENAI_API_URL = fake.completions_url
+        # the fake serves the same four images over and over
+        model.RESULT_CACHE = None
+        images = [fake.image_url(n) for n in range(n_images)]
+
+        # one image at a time, as run_model
+        session = create_session(1)
+        start = time.perf_counter()
+        for image in images[: args.sequential]:
+            model.get_ai_label(
+                model.vision_ai_classify_image(
+                    model.encode_image_to_base64(read_image(image, session)),
+                    model.FLOODING_PROMPT,
+                    session,
+                )
+            )
+        sequential = args.sequential / (time.perf_counter() - start)
+        print(f"sequential      {sequential:>7.1f} images/s")
+
+        output = os.path.join(directory.name, "results.jsonl")
+        fake.max_inflight = 0
+        stats = classify_batch(
+            images, output, workers=args.workers, max_inflight=args.inflight
+        )
+        check(fake, images, read_labels(output))
+        print(
+            f"classify_batch  {stats['images_per_second']:>7.1f} images/s"
+            f"  x{stats['images_per_second'] / sequential:.1f},"
+            f" {stats['classified']} images, at most {fake.max_inflight} calls"
+            f" in flight (limit {args.inflight})"
+        )
+        assert fake.max_inflight <= args.inflight
+
+        # a run killed while writing: a third of the lines and half of one
+        with open(output) as f:
+            lines = f.readlines()
+        cut = len(lines) // 3
+        resumed_output = os.path.join(directory.name, "resumed.jsonl")
+        with open(resumed_output, "w") as f:
+            f.writelines(lines[:cut])
+            f.write(lines[cut][: len(lines[cut]) // 2])
+        calls = fake.calls
+        stats = classify_batch(
+            images, resumed_output, workers=args.workers, max_inflight=args.inflight
+        )
+        check(fake, images, read_labels(resumed_output))
+        print(
+            f"resumed         {stats['skipped']} skipped,"
+            f" {fake.calls - calls} calls for the {stats['images']} left"
+        )
+        assert fake.calls - calls == len(images) - cut
+
+        # rate limited calls are recorded as failed, the next run retries them
+        fake.error_rate = 0.1
+        retried_output = os.path.join(directory.name, "retried.jsonl")
+        first = classify_batch(
+            images, retried_output, workers=args.workers, max_inflight=args.inflight
+        )
+        fake.error_rate = 0.0
+        second = classify_batch(
+            images, retried_output, workers=args.workers, max_inflight=args.inflight
+        )
+        check(fake, images, read_labels(retried_output))
+        print(
+            f"rate limited    {first['failed']} failed,"
+            f" {second['classified']} classified on the next run"
+        )
+        assert second["classified"] == first["failed"]
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
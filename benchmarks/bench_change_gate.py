@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Batch classification of camera snapshot sequences with and without the
+change gate, against the local stand-in for OpenAI. Each camera of
+cameras_aux.csv gets a sequence of frames of one sample of data/imgs with
+exposure changes and sensor and JPEG noise, and some switch to a sample
+of the other label midway, as a street that floods. Reports the calls
+avoided, the throughput and the labels that came out wrong, then times
+the gate of the whole fleet in one pass.
+
+  python benchmarks/bench_change_gate.py [--cameras N] [--frames N]
+      [--switch-rate P] [--threshold T] [--latency SECONDS]
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.model as model  # noqa: E402
+from fake_openai import IMAGES_PATH, FakeOpenAI  # noqa: E402
+from utils.batch import classify_batch, read_results  # noqa: E402
+from utils.change import THUMBNAIL_SIDE, ChangeGate  # noqa: E402
+
+CAMERAS_PATH = "./data/database/cameras_aux.csv"
+
+
+def frame(sample, rng):
+    # the sample as another capture of the same scene
+    pixels = np.asarray(sample, dtype=np.float32) * rng.uniform(0.93, 1.07)
+    pixels += np.random.default_rng(rng.getrandbits(32)).normal(0, 3, pixels.shape)
+    buffered = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(
+        buffered, format="JPEG", quality=rng.choice([70, 80, 90])
+    )
+    return buffered.getvalue()
+
+
+def snapshots(n_cameras, n_frames, switch_rate, seed=0):
+    # (name, bytes) of every frame, in capture order, and their true labels
+    rng = random.Random(seed)
+    samples = {}
+    for name in sorted(os.listdir(IMAGES_PATH)):
+        with Image.open(os.path.join(IMAGES_PATH, name)) as img:
+            samples[name] = img.convert("RGB")
+    flooded = [name for name in samples if not name.startswith("not_")]
+    dry = [name for name in samples if name.startswith("not_")]
+    with open(CAMERAS_PATH) as f:
+        cameras = [row["id_camera"] for row in csv.DictReader(f)][:n_cameras]
+
+    images, labels = [], {}
+    for camera in cameras:
+        scene = rng.choice(dry + flooded)
+        switch_at = n_frames
+        if rng.random() < switch_rate:
+            switch_at = rng.randrange(1, n_frames)
+        for n in range(n_frames):
+            if n == switch_at:
+                scene = rng.choice(flooded if scene in dry else dry)
+            name = f"{camera}_{n:04d}.jpg"
+            images.append((name, frame(samples[scene], rng)))
+            labels[name] = scene in flooded
+    return images, labels
+
+
+def run(fake, urls, output, gate, workers):
+    calls = fake.calls
+    stats = classify_batch(urls, output, workers=workers, gate=gate)
+    return stats, fake.calls - calls
+
+
+def wrong_labels(output, labels):
+    results = read_results(output)
+    return sum(
+        results[url]["label"] != labels[url.rsplit("/", 1)[1]] for url in results
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cameras", type=int, default=150)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--switch-rate", type=float, default=0.3)
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    images, labels = snapshots(args.cameras, args.frames, args.switch_rate)
+    scenes = args.cameras + sum(
+        labels[f"{name[:6]}_{n:04d}.jpg"] != labels[f"{name[:6]}_{n - 1:04d}.jpg"]
+        for name, _ in images[:: args.frames]
+        for n in range(1, args.frames)
+    )
+    print(
+        f"{len(images)} snapshots of {args.cameras} cameras,"
+        f" {scenes} scenes, so at best {1 - scenes / len(images):.0%} calls avoided"
+    )
+
+    directory = tempfile.TemporaryDirectory()
+    with FakeOpenAI(args.latency, images=images) as fake, directory:
+        model.OPENAI_API_URL = fake.completions_url
+        # the gate is measured on its own
+        model.RESULT_CACHE = None
+        urls = [fake.image_url(n) for n in range(len(images))]
+
+        print(f"{'':<10} {'calls':>6} {'avoided':>8} {'images/s':>9} {'wrong':>6}")
+        for name, gate in [
+            ("all", None),
+            ("gated", ChangeGate(args.threshold)),
+        ]:
+            output = os.path.join(directory.name, f"{name}.jsonl")
+            stats, calls = run(fake, urls, output, gate, args.workers)
+            print(
+                f"{name:<10} {calls:>6} {1 - calls / len(urls):>8.0%}"
+                f" {stats['images_per_second']:>9.1f}"
+                f" {wrong_labels(output, labels):>6}"
+            )
+
+    # the whole fleet in one pass
+    n_cameras = 2592
+    rng = np.random.default_rng(0)
+    size = THUMBNAIL_SIDE**2
+    gate = ChangeGate(args.threshold)
+    cameras = [str(n) for n in range(n_cameras)]
+    thumbnails = rng.integers(0, 256, (n_cameras, size), dtype=np.uint8)
+    for camera, thumb in zip(cameras, thumbnails):
+        gate.update(camera, thumb, {"label": False})
+    noisy = (thumbnails + rng.integers(-3, 4, thumbnails.shape)).clip(0, 255)
+    start = time.perf_counter()
+    changed = gate.changed(cameras, noisy.astype(np.uint8))
+    seconds = time.perf_counter() - start
+    print(
+        f"gate of {n_cameras} cameras in {seconds * 1000:.1f} ms,"
+        f" {changed.sum()} changed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Compares CameraSync against a full treat_data rebuild on the mock payload,
+on refreshes with synthetic mutations and on repeated ones that bring
+nothing new, on refreshes that only change a snapshot or a label
+explanation, and on a payload with a repeated camera id. Every refresh must
+produce the same frame as the full rebuild, both patching the changed
+cameras and treating the whole fleet. The timings are repeated on the mock
+cameras copied up to --cameras.
+
+  python benchmarks/bench_delta_sync.py [--cameras N]
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, "./app")
+
+from utils.sync import DELTA_MIN_CAMERAS, CameraSync  # noqa: E402
+from utils.treat import treat_data  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+LABELS = {
+    "image_corrupted": ["true", "false"],
+    "rain": ["true", "false"],
+    "water_level": ["low", "medium", "high"],
+    "road_blockade": ["free", "partially", "totally"],
+    "traffic": ["easy", "moderate", "difficult", "impossible"],
+}
+
+
+def new_timestamp(timestamp):
+    timestamp = datetime.fromisoformat(timestamp) + timedelta(minutes=2)
+    return timestamp.isoformat()
+
+
+def mutate(cameras, rng, n_changes):
+    cameras = copy.deepcopy(cameras)
+    with_identifications = [c for c in cameras if c["identifications"]]
+    without_identifications = [c for c in cameras if not c["identifications"]]
+
+    # new identifications for some cameras
+    for camera in rng.sample(with_identifications, n_changes):
+        for identification in camera["identifications"]:
+            identification["id"] = f"{identification['id']}-{rng.random()}"
+            identification["timestamp"] = new_timestamp(identification["timestamp"])
+            if identification["object"] in LABELS:
+                identification["label"] = rng.choice(LABELS[identification["object"]])
+            identification["snapshot"]["timestamp"] = new_timestamp(
+                identification["snapshot"]["timestamp"]
+            )
+
+    # a new snapshot and a new explanation, with everything else unchanged
+    snapshot_only(rng.choice(with_identifications), rng)
+    explanation_only(rng.choice(with_identifications), rng)
+
+    # cameras that start and stop reporting
+    donor = rng.choice(with_identifications)
+    for camera in rng.sample(
+        without_identifications, min(2, len(without_identifications))
+    ):
+        camera["identifications"] = copy.deepcopy(donor["identifications"])
+    rng.choice(with_identifications)["identifications"] = []
+
+    # cameras leaving the fleet and a different page order
+    cameras.pop(rng.randrange(len(cameras)))
+    rng.shuffle(cameras)
+    return cameras
+
+
+def snapshot_only(camera, rng):
+    snapshot = camera["identifications"][0]["snapshot"]
+    snapshot["id"] = f"{snapshot['id']}-{rng.random()}"
+    snapshot["image_url"] = f"{snapshot['image_url']}?v={rng.random()}"
+
+
+def explanation_only(camera, rng):
+    identification = camera["identifications"][-1]
+    identification["label_explanation"] = f"explanation {rng.random()}"
+
+
+def duplicated(cameras, rng):
+    # one camera listed twice and one that stopped reporting
+    cameras = copy.deepcopy(cameras)
+    with_identifications = [c for c in cameras if c["identifications"]]
+    cameras.append(copy.deepcopy(rng.choice(with_identifications)))
+    rng.choice(with_identifications)["identifications"] = []
+    return cameras
+
+
+def check(sync, cameras, name):
+    expected = treat_data(cameras)
+    pd.testing.assert_frame_equal(sync.update(cameras), expected)
+    print(f"{name}: identical to full rebuild")
+
+
+def check_changed(sync, cameras, change, name, rng):
+    # a refresh that only changes fields read by treat_data must not return
+    # the frame of the previous one
+    before = sync.update(cameras)
+    cameras = copy.deepcopy(cameras)
+    camera = next(
+        c for c in cameras if c["identifications"] and c["id"] in set(before["id"])
+    )
+    change(camera, rng)
+    after = sync.update(cameras)
+    assert not after.equals(before), f"{name}: returned the previous frame"
+    check(sync, cameras, name)
+    return cameras
+
+
+def scaled(cameras, n_cameras):
+    # the cameras with identifications copied under new ids up to n_cameras
+    with_identifications = [c for c in cameras if c["identifications"]]
+    copies = []
+    for n in range(n_cameras):
+        camera = copy.deepcopy(with_identifications[n % len(with_identifications)])
+        camera["id"] = f"{camera['id']}-{n // len(with_identifications)}"
+        copies.append(camera)
+    return copies
+
+
+def average(times):
+    return sum(times) / len(times) * 1000
+
+
+def timings(cameras, refreshes, n_changes, rng):
+    syncs = {"patched": CameraSync(min_delta_cameras=0), "default": CameraSync()}
+    times = {"full rebuild": [], "unchanged": []}
+    times.update({f"sync {name}": [] for name in syncs})
+    for refresh in range(refreshes):
+        if refresh > 0:
+            cameras = mutate(cameras, rng, n_changes)
+
+        start = time.perf_counter()
+        expected = treat_data(cameras)
+        times["full rebuild"].append(time.perf_counter() - start)
+
+        for name, sync in syncs.items():
+            start = time.perf_counter()
+            result = sync.update(cameras)
+            times[f"sync {name}"].append(time.perf_counter() - start)
+            pd.testing.assert_frame_equal(result, expected)
+
+        # an equal payload, as a new fetch returns
+        cameras = copy.deepcopy(cameras)
+        start = time.perf_counter()
+        result = syncs["patched"].update(cameras)
+        times["unchanged"].append(time.perf_counter() - start)
+        pd.testing.assert_frame_equal(result, expected)
+    # the first refresh treats every camera
+    return {name: average(values[1:] or values) for name, values in times.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cameras", type=int, default=10000)
+    parser.add_argument("--refreshes", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+
+    for min_delta_cameras in [0, DELTA_MIN_CAMERAS]:
+        sync = CameraSync(min_delta_cameras=min_delta_cameras)
+        name = f"min_delta_cameras={min_delta_cameras}"
+        for refresh in range(args.refreshes):
+            if refresh > 0:
+                cameras = mutate(cameras, rng, args.changes)
+            check(sync, cameras, f"{name}, refresh {refresh}")
+            check(sync, copy.deepcopy(cameras), f"{name}, refresh {refresh} again")
+        cameras = check_changed(sync, cameras, snapshot_only, f"{name}, snapshot", rng)
+        cameras = check_changed(
+            sync, cameras, explanation_only, f"{name}, label explanation", rng
+        )
+
+        with_duplicates = duplicated(cameras, rng)
+        check(sync, with_duplicates, f"{name}, repeated camera id")
+        check(
+            CameraSync(min_delta_cameras=min_delta_cameras),
+            with_duplicates,
+            f"{name}, repeated camera id, fresh sync",
+        )
+        check(sync, cameras, f"{name}, back from repeated camera id")
+
+    n_reporting = sum(bool(camera["identifications"]) for camera in cameras)
+    for fleet in [cameras, scaled(cameras, args.cameras)]:
+        n_cameras = sum(bool(camera["identifications"]) for camera in fleet)
+        n_changes = max(args.changes * n_cameras // n_reporting, 1)
+        print(
+            f"\n{n_cameras} cameras with identifications, {n_changes} changed per"
+            f" refresh (default min_delta_cameras={DELTA_MIN_CAMERAS})"
+        )
+        for name, ms in timings(fleet, args.refreshes, n_changes, rng).items():
+            print(f"{name + ':':<18} {ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the Home page pipeline against the fake Vision AI
+API built from the mock payload: fetching the cameras (all and active),
+treat_data, the query index, get_filted_cameras_objects, create_map and the
+AgGrid table prep, each timed on its own. Results can be written as JSON
+and compared with the ones of another commit.
+
+  python benchmarks/bench_e2e.py [--cameras N] [--identifications N]
+      [--latency SECONDS] [--repeat N] [--json PATH] [--compare PATH]
+"""
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.utils as app_utils  # noqa: E402
+from fake_api import FakeVisionAI, load_endpoints  # noqa: E402
+from utils.api import APIVisionAI  # noqa: E402
+from utils.query import QueryIndex  # noqa: E402
+from utils.taxonomy import load_taxonomy  # noqa: E402
+from utils.treat import treat_data  # noqa: E402
+
+OBJECT_FILTER = "nível da água"
+# stages slower than the compared results by more than this are regressions
+REGRESSION_RATIO = 1.2
+
+# the fetches log their progress
+logging.getLogger("utils").setLevel(logging.WARNING)
+
+
+def timed_runs(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    stats = {
+        "runs": repeat,
+        "min_ms": round(times[0] * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "p95_ms": round(times[min(repeat - 1, int(repeat * 0.95))] * 1000, 3),
+    }
+    return stats, result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def run(n_cameras, identifications, latency, repeat):
+    endpoints = load_endpoints(n_cameras, identifications)
+    stages, sizes = {}, {}
+    with FakeVisionAI(endpoints, faults={"latency": latency}) as fake:
+        # get_cameras runs outside of a Streamlit session, with the client
+        # used by the background refreshes
+        api = APIVisionAI("user", "password", base_url=fake.url)
+        app_utils._shared_client = api
+        load_taxonomy(api._get_all_pages("/objects"))
+
+        stages["get_cameras"], cameras = timed_runs(
+            lambda: app_utils.get_cameras(only_active=False), repeat
+        )
+        stages["get_cameras_active"], _ = timed_runs(
+            lambda: app_utils.get_cameras(only_active=True), repeat
+        )
+
+    stages["treat_data"], df = timed_runs(lambda: treat_data(cameras), repeat)
+    stages["query_index"], query_index = timed_runs(lambda: QueryIndex(df), repeat)
+    labels = query_index.labels(OBJECT_FILTER)
+    stages["get_filted_cameras_objects"], filtered = timed_runs(
+        lambda: app_utils.get_filted_cameras_objects(
+            df, OBJECT_FILTER, labels, query_index=query_index
+        ),
+        repeat,
+    )
+    stages["get_filted_cameras_objects_scan"], _ = timed_runs(
+        lambda: app_utils.get_filted_cameras_objects(df, OBJECT_FILTER, labels),
+        repeat,
+    )
+    stages["create_map"], _ = timed_runs(lambda: app_utils.create_map(filtered), repeat)
+    stages["prepare_aggrid_table"], _ = timed_runs(
+        lambda: app_utils.prepare_aggrid_table(filtered), repeat
+    )
+
+    sizes = {
+        "cameras": len(cameras),
+        "identifications": len(df),
+        "filtered_rows": len(filtered),
+    }
+    return stages, sizes
+
+
+def compare(results, baseline):
+    # prints the change of each stage median and returns the regressions
+    regressions = []
+    print(f"\ncompared with {baseline.get('commit')}")
+    if baseline.get("config") != results["config"]:
+        print(f"warning: run with another config {baseline.get('config')}")
+    for stage, stats in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if not before:
+            continue
+        ratio = stats["median_ms"] / before["median_ms"] if before["median_ms"] else 1
+        flag = ""
+        if ratio > REGRESSION_RATIO:
+            flag = "  REGRESSION"
+            regressions.append(stage)
+        print(
+            f"{stage:<34} {before['median_ms']:>10.1f} -> {stats['median_ms']:>10.1f} ms"
+            f"  x{ratio:.2f}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--cameras", type=int, default=None)
+    parser.add_argument("--identifications", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--compare", help="results of another commit")
+    args = parser.parse_args()
+
+    stages, sizes = run(args.cameras, args.identifications, args.latency, args.repeat)
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "cameras": args.cameras,
+            "identifications_per_camera": args.identifications,
+            "latency": args.latency,
+            "repeat": args.repeat,
+        },
+        "sizes": sizes,
+        "stages": stages,
+    }
+
+    print(f"{sizes}")
+    print(f"{'stage':<34} {'min':>10} {'median':>10} {'p95':>10}")
+    for stage, stats in stages.items():
+        print(
+            f"{stage:<34} {stats['min_ms']:>7.1f} ms {stats['median_ms']:>7.1f} ms"
+            f" {stats['p95_ms']:>7.1f} ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Request bytes and classification latency of the images sent to the vision
+model, with the encoding as it was (file paths re-encoded to JPEG at the
+default quality, uploads sent as they are) and with prepare_image. Runs
+on the samples of data/imgs, as paths and as uploads, and on a large photo
+and screenshot uploaded, against the local stand-in for OpenAI with its
+upload time.
+
+  python benchmarks/bench_image_payload.py [--latency SECONDS]
+      [--upload-mbps N] [--repeat N]
+"""
+import argparse
+import base64
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.model as model  # noqa: E402
+from fake_openai import IMAGES_PATH, FakeOpenAI  # noqa: E402
+from PIL import Image  # noqa: E402
+
+
+def legacy_encode_image_to_base64(image):
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            buffered = io.BytesIO()
+            img.save(buffered, format="JPEG")
+
+            bytes_data = buffered.getvalue()
+
+    else:
+        bytes_data = image.getvalue()
+
+    return base64.b64encode(bytes_data).decode("utf-8")
+
+
+def uploads():
+    # a phone photo and a screenshot, made from a sample
+    with Image.open(os.path.join(IMAGES_PATH, "flooded1.jpg")) as img:
+        photo = io.BytesIO()
+        img.resize((4032, 2268)).save(photo, format="JPEG", quality=95)
+        screenshot = io.BytesIO()
+        img.resize((1920, 1080)).save(screenshot, format="PNG")
+    return [("photo 4032x2268 upload", photo), ("png 1920x1080 upload", screenshot)]
+
+
+def cases():
+    for name in sorted(os.listdir(IMAGES_PATH)):
+        path = os.path.join(IMAGES_PATH, name)
+        yield f"{name} path", path
+        with open(path, "rb") as f:
+            yield f"{name} upload", io.BytesIO(f.read())
+    yield from uploads()
+
+
+def measure(fake, encode, image, repeat):
+    # request bytes and median seconds of encoding and classifying the image
+    times = []
+    for _ in range(repeat):
+        received = fake.bytes_received
+        start = time.perf_counter()
+        response = model.vision_ai_classify_image(encode(image), model.FLOODING_PROMPT)
+        times.append(time.perf_counter() - start)
+        model.get_ai_label(response)
+    return fake.bytes_received - received, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--upload-mbps", type=float, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    upload_rate = args.upload_mbps * 1e6 / 8
+    totals = {"before": [0, 0.0], "after": [0, 0.0]}
+    with FakeOpenAI(args.latency, upload_rate=upload_rate) as fake:
+        model.OPENAI_API_URL = fake.completions_url
+        print(
+            f"{'image':<28} {'bytes before':>13} {'after':>9}"
+            f" {'s before':>9} {'after':>7}"
+        )
+        for name, image in cases():
+            before = measure(fake, legacy_encode_image_to_base64, image, args.repeat)
+            after = measure(fake, model.encode_image_to_base64, image, args.repeat)
+            if name.endswith(".jpg path") or name.endswith(".jpg upload"):
+                for key, (n_bytes, seconds) in [("before", before), ("after", after)]:
+                    totals[key][0] += n_bytes
+                    totals[key][1] += seconds
+            print(
+                f"{name:<28} {before[0]:>13,} {after[0]:>9,}"
+                f" {before[1]:>9.3f} {after[1]:>7.3f}"
+            )
+    print(
+        f"{'data/imgs total':<28} {totals['before'][0]:>13,} {totals['after'][0]:>9,}"
+        f" {totals['before'][1]:>9.3f} {totals['after'][1]:>7.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
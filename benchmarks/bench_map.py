@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Times building and rendering the map with one folium.Marker per row against
+# the single GeoJSON layer, with and without clustering, and reports the size
+# of the HTML sent to the browser.
+#
+#   python benchmarks/bench_map.py [n_points ...]
+import json
+import sys
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from bench_treat_data import scale_payload  # noqa: E402
+from utils.maps import add_camera_layer, add_camera_markers, base_map  # noqa: E402
+from utils.treat import treat_data  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+MODES = {
+    "markers": lambda m, data: add_camera_markers(m, data),
+    "layer": lambda m, data: add_camera_layer(m, data, cluster=False),
+    "layer + cluster": lambda m, data: add_camera_layer(m, data, cluster=True),
+}
+
+
+def build(mode, chart_data):
+    start = time.perf_counter()
+    m = MODES[mode](base_map(chart_data), chart_data)
+    html = m.get_root().render()
+    return time.perf_counter() - start, len(html.encode("utf-8"))
+
+
+def main(*sizes):
+    sizes = sizes or (500, 3_000, 10_000)
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    reporting = [camera for camera in cameras if camera["identifications"]]
+
+    print(f"{'points':>8} {'mode':<16} {'build + render':>15} {'html':>10}")
+    for n_points in sizes:
+        # one row per camera, as in the map of a single object
+        chart_data = treat_data(scale_payload(reporting, n_points))
+        chart_data = chart_data.drop_duplicates("id").head(n_points)
+        for mode in MODES:
+            seconds, size = build(mode, chart_data)
+            print(
+                f"{len(chart_data):>8} {mode:<16} {seconds * 1000:>12.0f} ms"
+                f" {size / 1024:>7.0f} KB"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
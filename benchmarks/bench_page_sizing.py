@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Fetches the mock fleet from the fake API several times in a row with the
+# page size picked by the client, next to the fixed sizes used before (100
+# and 3000). The fake charges a fixed latency per request plus a latency per
+# item. Reports time, requests and the chosen page size and concurrency of
+# each fetch. Checks every camera is returned exactly once and no empty page
+# or probe is requested.
+#
+#   python benchmarks/bench_page_sizing.py [fetches]
+import json
+import sys
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from fake_api import FakeVisionAI  # noqa: E402
+from utils.api import APIVisionAI  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+LATENCY = {"latency": 0.05, "item_latency": 0.0005}
+
+
+def fetch(api, page_size, expected_ids):
+    stats = api.new_stats()
+    start = time.perf_counter()
+    cameras = api._get_all_pages("/cameras", page_size=page_size, stats=stats)
+    seconds = time.perf_counter() - start
+    assert sorted(camera["id"] for camera in cameras) == expected_ids
+    paging = stats["paging"]["/cameras"]
+    assert stats["requests"] == paging["pages"]
+    return seconds, stats["requests"], paging
+
+
+def main(fetches=5):
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    expected_ids = sorted(camera["id"] for camera in cameras)
+
+    print(f"{len(cameras)} cameras, latency {LATENCY}")
+    for name, page_size in [("fixed 100", 100), ("fixed 3000", 3000), ("tuned", None)]:
+        with FakeVisionAI({"/cameras": cameras}, faults=LATENCY) as fake:
+            api = APIVisionAI("user", "password", base_url=fake.url)
+            for i in range(fetches):
+                seconds, requests, paging = fetch(api, page_size, expected_ids)
+                print(
+                    f"{name:<10} fetch {i + 1}  {seconds:.2f} s  {requests:>3} requests"
+                    f"  page size {paging['page_size']:>4}"
+                    f"  concurrency {paging['concurrency']:>2}"
+                )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Recall, escalation and throughput of the water prefilter, and the cascade
+of prefilter and vision model against the local stand-in for OpenAI.
+
+Without --labeled, the images are captures made from each sample of
+data/imgs (crops, flips, exposure, sensor and JPEG noise), evaluated
+leaving each sample out: the prefilter trained on the captures of the
+other three scores the captures of the one left out, and the snapshots of
+the one left out in the cascade of prefilter and model. With --labeled, the
+snapshots labeled by their path in a CSV or directory, as the
+images_with_label ones of data/temp/mock_image_classification.csv, are
+cross-validated leaving the snapshots of each camera out together.
+
+  python benchmarks/bench_prefilter.py [--labeled SOURCE] [--captures N]
+      [--recall R] [--dry-share P] [--latency SECONDS]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.model as model  # noqa: E402
+from bench_change_gate import frame  # noqa: E402
+from fake_openai import IMAGES_PATH, FakeOpenAI  # noqa: E402
+from utils.batch import (  # noqa: E402
+    classify_batch,
+    create_session,
+    list_images,
+    read_image,
+    read_results,
+)
+from utils.change import camera_of  # noqa: E402
+from utils.prefilter import (  # noqa: E402
+    WaterPrefilter,
+    cross_validate,
+    evaluate,
+    label_of,
+    water_features,
+)
+
+
+def capture(sample, rng):
+    # another capture of the scene: cropped, maybe mirrored, with noise
+    width, height = sample.size
+    crop = rng.uniform(0.8, 1.0)
+    left = rng.uniform(0, 1 - crop) * width
+    top = rng.uniform(0, 1 - crop) * height
+    image = sample.crop(
+        (int(left), int(top), int(left + crop * width), int(top + crop * height))
+    ).resize((width, height))
+    if rng.random() < 0.5:
+        image = ImageOps.mirror(image)
+    return frame(image, rng)
+
+
+def sample_captures(n_captures, make=capture, seed=0):
+    # {sample name: [JPEG bytes]}
+    rng = random.Random(seed)
+    captures = {}
+    for name in sorted(os.listdir(IMAGES_PATH)):
+        with Image.open(os.path.join(IMAGES_PATH, name)) as img:
+            sample = img.convert("RGB")
+        captures[name] = [make(sample, rng) for _ in range(n_captures)]
+    return captures
+
+
+def features_of(contents):
+    return np.stack([water_features(io.BytesIO(content)) for content in contents])
+
+
+def percent(found, total):
+    return f"{found / total:.1%}" if total else "n/a"
+
+
+def leave_one_sample_out(captures, recall):
+    print(f"{'left out':<18} {'threshold':>9} {'recall':>7} {'escalated':>10}")
+    for name in captures:
+        train = [other for other in captures if other != name]
+        features = np.concatenate([features_of(captures[other]) for other in train])
+        labels = np.concatenate(
+            [[label_of(other)] * len(captures[other]) for other in train]
+        )
+        scenes = np.concatenate([[other] * len(captures[other]) for other in train])
+        prefilter, _ = WaterPrefilter.fit(features, labels, recall, groups=scenes)
+        scores = prefilter.score_features(features_of(captures[name]))
+        result = evaluate(scores, [label_of(name)] * len(scores), prefilter.threshold)
+        # recall on a dry sample is its share of images sent to the model
+        print(
+            f"{name:<18} {prefilter.threshold:>9.3f}"
+            f" {percent(result['recall'], 1) if label_of(name) else 'n/a':>7}"
+            f" {result['escalated']:>10.1%}"
+        )
+
+
+def labeled(source, recall):
+    session = create_session(8)
+    features, labels, cameras = [], [], []
+    for image in list_images(source):
+        label = label_of(image)
+        if label is None:
+            continue
+        try:
+            features.append(water_features(read_image(image, session, 60)))
+        except Exception as exc:
+            print(f"skipped {image}: {exc!r}")
+            continue
+        labels.append(label)
+        cameras.append(camera_of(image))
+    if not labels:
+        raise SystemExit(f"no labeled snapshots could be read from {source}")
+    result = cross_validate(features, labels, cameras, recall)
+    print(
+        f"{result['images']} snapshots of {len(set(cameras))} cameras,"
+        f" {result['flooded']} flooded: recall {result['recall']:.1%},"
+        f" escalated {result['escalated']:.1%} (5 folds of cameras left out)"
+    )
+
+
+def throughput(repeat=200):
+    paths = [
+        os.path.join(IMAGES_PATH, name) for name in sorted(os.listdir(IMAGES_PATH))
+    ]
+    start = time.process_time()
+    for n in range(repeat):
+        water_features(paths[n % len(paths)])
+    seconds = (time.process_time() - start) / repeat
+    print(
+        f"scoring: {seconds * 1000:.2f} ms of CPU per 854x480 snapshot,"
+        f" {1 / seconds:.0f} snapshots/s on one core"
+    )
+
+
+def cascade(captures, recall, dry_share, n_images, latency, workers):
+    # a stream with dry_share dry snapshots, with and without the prefilter.
+    # The snapshots of each scene go through the prefilter trained on the
+    # captures of the other scenes, so none of them is scored by a model
+    # that saw its scene. They are not cropped, so the stand-in recognizes
+    # them and answers as the model would
+    rng = random.Random(1)
+    test = sample_captures(20, make=frame, seed=1)
+    dry = [name for name in test if not label_of(name)]
+    flooded = [name for name in test if label_of(name)]
+    images, scenes = [], {}
+    for n in range(n_images):
+        name = rng.choice(dry if rng.random() < dry_share else flooded)
+        image_name = f"{n:06d}_{name}"
+        images.append((image_name, rng.choice(test[name])))
+        scenes.setdefault(name, []).append(n)
+
+    print(
+        f"\ncascade on {n_images} snapshots, {dry_share:.0%} dry,"
+        f" model latency {latency:.1f} s, each scene held out of the prefilter"
+    )
+    print(
+        f"{'':<10} {'scene':<18} {'calls':>6} {'seconds':>8}"
+        f" {'recall':>7} {'accuracy':>9}"
+    )
+    with FakeOpenAI(latency, images=images) as fake, tempfile.TemporaryDirectory() as d:
+        model.OPENAI_API_URL = fake.completions_url
+        model.RESULT_CACHE = None
+        for stage in ["model", "cascade"]:
+            total = {"calls": 0, "seconds": 0.0, "found": 0, "flooded": 0, "correct": 0}
+            for scene, numbers in scenes.items():
+                prefilter = None
+                if stage == "cascade":
+                    train = [other for other in captures if other != scene]
+                    prefilter, _ = WaterPrefilter.fit(
+                        np.concatenate([features_of(captures[o]) for o in train]),
+                        np.concatenate(
+                            [[label_of(o)] * len(captures[o]) for o in train]
+                        ),
+                        recall,
+                        groups=np.concatenate([[o] * len(captures[o]) for o in train]),
+                    )
+                output = os.path.join(d, f"{stage}_{scene}.jsonl")
+                calls = fake.calls
+                stats = classify_batch(
+                    [fake.image_url(n) for n in numbers],
+                    output,
+                    workers=workers,
+                    prefilter=prefilter,
+                )
+                labels = [result["label"] for result in read_results(output).values()]
+                flooded_count = len(labels) if label_of(scene) else 0
+                found = sum(labels) if label_of(scene) else 0
+                correct = sum(label == label_of(scene) for label in labels)
+                print(
+                    f"{stage:<10} {scene:<18} {fake.calls - calls:>6}"
+                    f" {stats['seconds']:>8.2f} {percent(found, flooded_count):>7}"
+                    f" {percent(correct, len(labels)):>9}"
+                )
+                total["calls"] += fake.calls - calls
+                total["seconds"] += stats["seconds"]
+                total["found"] += found
+                total["flooded"] += flooded_count
+                total["correct"] += correct
+            print(
+                f"{stage:<10} {'all':<18} {total['calls']:>6}"
+                f" {total['seconds']:>8.2f} {percent(total['found'], total['flooded']):>7}"
+                f" {percent(total['correct'], n_images):>9}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--labeled", help="CSV or directory of labeled snapshots")
+    parser.add_argument("--captures", type=int, default=120)
+    parser.add_argument("--recall", type=float, default=0.98)
+    parser.add_argument("--dry-share", type=float, default=0.8)
+    parser.add_argument("--images", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    throughput()
+    if args.labeled:
+        labeled(args.labeled, args.recall)
+    captures = sample_captures(args.captures)
+    print()
+    leave_one_sample_out(captures, args.recall)
+    cascade(
+        captures,
+        args.recall,
+        args.dry_share,
+        args.images,
+        args.latency,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Per-click latency of the Home page lookups (object list, labels of the
+# selected object, filtered rows and camera details) with full scans of the
+# treated frame against the QueryIndex, on the mock payload scaled to a given
+# number of cameras, every camera reporting.
+#
+#   python benchmarks/bench_query_index.py [n_cameras]
+import json
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from bench_treat_data import scale_payload  # noqa: E402
+from utils.query import QueryIndex  # noqa: E402
+from utils.treat import treat_data  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+
+
+def scan_click(frame, object_, camera_id):
+    objects = frame["object"].unique().tolist()
+    objects.sort()
+    labels = frame[frame["object"] == object_]["label"].dropna().unique().tolist()
+    rows = frame[(frame["object"] == object_) & (frame["label"].isin(labels))]
+    camera = frame[frame["id"] == camera_id]
+    return objects, labels, rows, camera
+
+
+def index_click(index, object_, camera_id):
+    objects = index.objects
+    labels = index.labels(object_)
+    rows = index.filter(object_, labels)
+    camera = index.camera(camera_id)
+    return objects, labels, rows, camera
+
+
+def per_click(func, *args, clicks=50):
+    start = time.perf_counter()
+    for _ in range(clicks):
+        result = func(*args)
+    return (time.perf_counter() - start) / clicks, result
+
+
+def main(n_cameras=10_000):
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    reporting = [camera for camera in cameras if camera["identifications"]]
+    frame = treat_data(scale_payload(reporting, n_cameras))
+    print(f"{n_cameras} cameras, {len(frame)} treated identifications")
+
+    start = time.perf_counter()
+    index = QueryIndex(frame)
+    build_time = time.perf_counter() - start
+
+    for object_ in index.objects:
+        camera_id = frame["id"].iloc[len(frame) // 2]
+        scan_time, expected = per_click(scan_click, frame, object_, camera_id)
+        index_time, result = per_click(index_click, index, object_, camera_id)
+
+        assert result[0] == expected[0] and result[1] == expected[1]
+        pd.testing.assert_frame_equal(result[2], expected[2])
+        pd.testing.assert_frame_equal(result[3], expected[3])
+        print(
+            f"{object_:<22} {len(result[2]):>6} rows"
+            f"  scan {scan_time * 1000:6.2f} ms"
+            f"  index {index_time * 1000:6.2f} ms"
+        )
+    print(f"index built once per refresh in {build_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
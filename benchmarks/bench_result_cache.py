@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+run_model with the classification cache, against the local stand-in for
+OpenAI: the first call of each sample of data/imgs goes to the model, the
+next ones come from the cache, also after a restart (a new cache on the
+same file). Then checks the LRU bound and the TTL.
+
+  python benchmarks/bench_result_cache.py [--latency SECONDS] [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import utils.model as model  # noqa: E402
+from fake_openai import IMAGES_PATH, FakeOpenAI  # noqa: E402
+from utils.cache import ResultCache  # noqa: E402
+
+
+def timed(func, repeat=1):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(IMAGES_PATH, name) for name in sorted(os.listdir(IMAGES_PATH))
+    ]
+    directory = tempfile.TemporaryDirectory()
+    with FakeOpenAI(args.latency) as fake, directory:
+        model.OPENAI_API_URL = fake.completions_url
+        path = os.path.join(directory.name, "classifications.sqlite")
+        model.RESULT_CACHE = ResultCache(path, name="classifications")
+
+        print(f"{'image':<18} {'miss':>8} {'hit':>10} {'after restart':>14}")
+        hits = misses = 0
+        for image in paths:
+            label, miss = timed(lambda: model.run_model(image, model.FLOODING_PROMPT))
+            cached, hit = timed(
+                lambda: model.run_model(image, model.FLOODING_PROMPT), args.repeat
+            )
+            assert cached == label
+            hits += model.RESULT_CACHE.hits
+            misses += model.RESULT_CACHE.misses
+            model.RESULT_CACHE = ResultCache(path, name="classifications")
+            _, restarted = timed(lambda: model.run_model(image, model.FLOODING_PROMPT))
+            print(
+                f"{os.path.basename(image):<18} {miss:>7.3f}s {hit * 1e6:>7.0f} µs"
+                f" {restarted * 1e6:>11.0f} µs"
+            )
+        hits += model.RESULT_CACHE.hits
+        misses += model.RESULT_CACHE.misses
+        assert fake.calls == misses == len(paths), fake.calls
+        print(f"{fake.calls} model calls, {hits} hits, {misses} misses")
+
+        # a new prompt is a new key
+        model.run_model(paths[0], model.FLOODING_PROMPT + " ")
+        assert fake.calls == len(paths) + 1
+
+    # the least recently used go first, on disk too
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bounded.sqlite")
+        cache = ResultCache(path, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert cache.get("b") is None and cache.get("a") == 1
+        assert len(ResultCache(path, max_entries=2)) == 2
+
+        cache = ResultCache(ttl=0.1)
+        cache.put("a", 1)
+        assert cache.get("a") == 1
+        time.sleep(0.15)
+        assert cache.get("a") is None
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
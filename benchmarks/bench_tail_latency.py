@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Refreshes the whole fleet through the paginator against the fake API with
+# injected errors, dropped connections and slow pages, with and without
+# retries and hedging. Reports p50/p99 refresh time and failed refreshes and
+# checks every successful refresh returns each camera exactly once. Then
+# checks a page that always fails is skipped and listed with partial=True,
+# also after a warm fetch, when the failing page gets hedged.
+#
+#   python benchmarks/bench_tail_latency.py [refreshes]
+import json
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from fake_api import FakeVisionAI  # noqa: E402
+from utils.api import APIVisionAI  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+PAGE_SIZE = 100
+FAULTS = {
+    "latency": 0.02,
+    "error_rate": 0.03,
+    "drop_rate": 0.01,
+    "slow_rate": 0.03,
+    "slow_delay": 2.0,
+}
+CONFIGS = {
+    "no retries": {"retries": 0, "hedge_percentile": None},
+    "retries": {"retries": 3, "hedge_percentile": None},
+    "retries + hedging": {"retries": 3, "hedge_percentile": 0.9},
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def refresh_times(fake, config, expected_ids, refreshes):
+    api = APIVisionAI("user", "password", base_url=fake.url, backoff=0.1, **config)
+    times, failed, stats = [], 0, api.new_stats()
+    for _ in range(refreshes):
+        start = time.perf_counter()
+        try:
+            cameras = api._get_all_pages(
+                "/cameras", page_size=PAGE_SIZE, stats=stats, total=len(expected_ids)
+            )
+        except Exception:
+            failed += 1
+            continue
+        times.append(time.perf_counter() - start)
+        assert sorted(camera["id"] for camera in cameras) == expected_ids
+    return times, failed, stats
+
+
+def check_partial(cameras):
+    expected_ids = sorted(camera["id"] for camera in cameras)
+    with FakeVisionAI({"/cameras": cameras}, faults={"failing_pages": [7]}) as fake:
+        api = APIVisionAI("user", "password", base_url=fake.url, backoff=0.05)
+        stats = api.new_stats()
+        result = api._get_all_pages(
+            "/cameras", page_size=PAGE_SIZE, stats=stats, partial=True
+        )
+    missing = set(expected_ids) - {camera["id"] for camera in result}
+    assert stats["failed_pages"] == [f"/cameras?page=7&size={PAGE_SIZE}"]
+    assert len(missing) == PAGE_SIZE
+    print(
+        f"partial: {len(result)} of {len(expected_ids)} cameras,"
+        f" failed pages {stats['failed_pages']}"
+    )
+
+
+def check_partial_hedged(cameras, timeout=30):
+    # after a warm fetch there are latencies, so the failing page is hedged.
+    # It must be hedged once and the fetch must end
+    expected_ids = sorted(camera["id"] for camera in cameras)
+    with FakeVisionAI({"/cameras": cameras}, faults={"latency": 0.02}) as fake:
+        api = APIVisionAI("user", "password", base_url=fake.url, backoff=0.05)
+        api._get_all_pages("/cameras", page_size=PAGE_SIZE)
+        fake.faults["failing_pages"] = [7]
+        stats, result = api.new_stats(), []
+
+        def fetch():
+            result.extend(
+                api._get_all_pages(
+                    "/cameras", page_size=PAGE_SIZE, stats=stats, partial=True
+                )
+            )
+
+        thread = threading.Thread(target=fetch, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        assert not thread.is_alive(), f"still fetching after {timeout} s: {stats}"
+    assert stats["failed_pages"] == [f"/cameras?page=7&size={PAGE_SIZE}"]
+    assert len(result) == len(expected_ids) - PAGE_SIZE
+    # the failing page is requested by its first request and one hedge at
+    # most, each with its retries
+    assert fake.injected["error"] <= 2 * (api.retries + 1), fake.injected
+    print(
+        f"partial after a warm fetch: {len(result)} of {len(expected_ids)} cameras,"
+        f" hedged {stats['hedged']}, {fake.injected['error']} requests to the"
+        " failing page"
+    )
+
+
+def main(refreshes=30):
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    expected_ids = sorted(camera["id"] for camera in cameras)
+
+    print(f"{refreshes} refreshes of {len(cameras)} cameras, faults {FAULTS}")
+    for name, config in CONFIGS.items():
+        with FakeVisionAI({"/cameras": cameras}, faults=FAULTS) as fake:
+            times, failed, stats = refresh_times(fake, config, expected_ids, refreshes)
+        print(
+            f"{name:<18} failed {failed:>2}/{refreshes}"
+            f"  p50 {statistics.median(times):.2f} s"
+            f"  p99 {percentile(times, 0.99):.2f} s"
+            f"  retries {stats['retries']:>3}  hedged {stats['hedged']:>3}"
+        )
+    check_partial(cameras)
+    check_partial_hedged(cameras)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Times treat_data against the previous explode/json_normalize implementation
+# on the mock payload scaled to a given number of cameras, checks both return
+# the same values and reports the memory used by each column.
+#
+#   python benchmarks/bench_treat_data.py [n_cameras]
+import copy
+import json
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+import legacy_treat  # noqa: E402
+from utils.treat import treat_data  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+
+
+def scale_payload(cameras, n_cameras):
+    # repeat the fleet until it has n_cameras, with distinct camera ids
+    scaled = []
+    while len(scaled) < n_cameras:
+        copy_number = len(scaled) // len(cameras)
+        for camera in cameras[: n_cameras - len(scaled)]:
+            camera = copy.deepcopy(camera)
+            if copy_number:
+                camera["id"] = f"{camera['id']}-{copy_number}"
+            scaled.append(camera)
+    return scaled
+
+
+def best_of(func, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def run(cameras):
+    n_identifications = sum(len(camera["identifications"]) for camera in cameras)
+    print(f"{len(cameras)} cameras, {n_identifications} identifications")
+
+    legacy_time, expected = best_of(legacy_treat.treat_data, cameras)
+    new_time, result = best_of(treat_data, cameras)
+    # same values, only the dtypes differ (categoricals instead of objects)
+    pd.testing.assert_frame_equal(result.astype(expected.dtypes.to_dict()), expected)
+
+    print(f"legacy treat_data: {legacy_time * 1000:.1f} ms")
+    print(f"treat_data:        {new_time * 1000:.1f} ms")
+    print(f"speedup:           {legacy_time / new_time:.1f}x, same output")
+    memory_report(expected, result)
+
+
+def memory_report(before, after):
+    before = before.memory_usage(deep=True)
+    after = after.memory_usage(deep=True)
+    report = pd.DataFrame({"before": before, "after": after})
+    report.loc["total"] = report.sum()
+    report["ratio"] = (report["before"] / report["after"]).round(1)
+    print(report.to_string())
+
+
+def main(n_cameras=10_000):
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    # the fleet as it is, most cameras without identifications
+    run(scale_payload(cameras, n_cameras))
+    # every camera reporting
+    reporting = [camera for camera in cameras if camera["identifications"]]
+    run(scale_payload(reporting, n_cameras))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
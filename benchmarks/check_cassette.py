@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Records a fetch of the catalog from the fake API (login, /cameras,
+# /objects and a plain requests.get) into a cassette, stops the fake, then
+# replays it offline with the recorded latency and without latency. Checks
+# the replays return the same data, a request that was not recorded fails as
+# if the network was down, and neither the password nor the tokens are in
+# the cassette.
+#
+#   python benchmarks/check_cassette.py
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from fake_api import FakeVisionAI, load_endpoints  # noqa: E402
+
+LATENCY = 0.05
+PASSWORD = "cassette-check-password"
+
+
+def fetch(url):
+    # runs in a child process, where the cassette is installed from the env
+    import requests
+    from utils.api import APIVisionAI
+    from utils.cassette import CassetteMiss
+
+    start = time.perf_counter()
+    api = APIVisionAI("user", PASSWORD, base_url=url)
+    data = {
+        "cameras": api._get_all_pages("/cameras", page_size=500),
+        "objects": api._get_all_pages("/objects"),
+        "prompts": requests.get(
+            f"{url}/prompts?size=10&page=1", headers=api.headers
+        ).json(),
+    }
+    seconds = time.perf_counter() - start
+    missing = None
+    if os.environ["HTTP_CASSETTE_MODE"] == "replay":
+        try:
+            requests.get(f"{url}/prompts?page=2&size=10", headers=api.headers)
+            missing = "answered"
+        except CassetteMiss:
+            missing = "CassetteMiss"
+        except requests.ConnectionError:
+            missing = "ConnectionError"
+    # the pages come in the order they are fetched
+    for name in ["cameras", "objects"]:
+        data[name].sort(key=lambda item: json.dumps(item, sort_keys=True))
+    payload = json.dumps(data, sort_keys=True).encode()
+    print(
+        json.dumps(
+            {
+                "seconds": seconds,
+                "digest": hashlib.sha256(payload).hexdigest(),
+                "missing": missing,
+            }
+        )
+    )
+
+
+def run(url, mode, path, scale=1):
+    env = {
+        **os.environ,
+        "HTTP_CASSETTE_MODE": mode,
+        "HTTP_CASSETTE": path,
+        "HTTP_CASSETTE_LATENCY_SCALE": str(scale),
+    }
+    output = subprocess.run(
+        [sys.executable, __file__, url], env=env, capture_output=True, text=True
+    )
+    for line in reversed(output.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(output.stderr[-2000:])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.jsonl")
+        with FakeVisionAI(
+            load_endpoints(), faults={"latency": LATENCY}, password=PASSWORD
+        ) as fake:
+            url = fake.url
+            recorded = run(url, "record", path)
+            secrets = [PASSWORD, *fake.tokens]
+        # the fake is down from here on, every response comes from the cassette
+        replayed = run(url, "replay", path)
+        instant = run(url, "replay", path, scale=0)
+        with open(path) as f:
+            lines = f.readlines()
+    n_interactions = len(lines)
+    leaked = [secret for secret in secrets if any(secret in line for line in lines)]
+
+    print(f"{n_interactions} interactions recorded")
+    for name, result in [
+        ("record", recorded),
+        ("replay", replayed),
+        ("replay x0", instant),
+    ]:
+        print(
+            f"{name:<10} {result['seconds']:.2f} s  digest {result['digest'][:12]}"
+            f"  unrecorded request: {result['missing'] or '-'}"
+        )
+    assert replayed["digest"] == recorded["digest"] == instant["digest"]
+    assert replayed["missing"] == instant["missing"] == "CassetteMiss"
+    assert not leaked, f"secrets in the cassette: {leaked}"
+    print("ok")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        fetch(sys.argv[1])
+    else:
+        main()
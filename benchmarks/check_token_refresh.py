@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Sends 200 concurrent requests through one APIVisionAI against the fake API
+# with the token expired, revoked on the server and about to expire, and
+# checks each case makes exactly one call to /auth/token.
+#
+#   python benchmarks/check_token_refresh.py
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, "./app")
+sys.path.insert(0, "./benchmarks")
+
+from fake_api import FakeVisionAI  # noqa: E402
+from utils.api import APIVisionAI  # noqa: E402
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+N_REQUESTS = 200
+
+
+def burst(api, n_requests=N_REQUESTS):
+    paths = [f"/cameras?page={i % 26 + 1}&size=100" for i in range(n_requests)]
+    with ThreadPoolExecutor(max_workers=n_requests) as executor:
+        return list(executor.map(api._get, paths))
+
+
+def check(name, fake, api, prepare):
+    prepare()
+    token_calls = fake.token_calls
+    start = time.perf_counter()
+    responses = burst(api)
+    elapsed = time.perf_counter() - start
+    time.sleep(0.2)  # let a background refresh finish
+    calls = fake.token_calls - token_calls
+    assert all(response["items"] for response in responses)
+    assert calls == 1, f"{name}: {calls} token calls"
+    print(f"{name:<16} {N_REQUESTS} requests, {calls} token call, {elapsed:.2f} s")
+
+
+def main():
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    with FakeVisionAI({"/cameras": cameras}) as fake:
+        api = APIVisionAI(
+            "user",
+            "password",
+            max_workers=64,
+            max_connections_per_host=64,
+            base_url=fake.url,
+        )
+        tokens = api.tokens
+
+        def expire():
+            tokens._issued_at -= tokens.lifetime
+
+        def about_to_expire():
+            tokens._issued_at -= tokens.lifetime - tokens.refresh_margin / 2
+
+        check("expired", fake, api, expire)
+        check("revoked (401)", fake, api, fake.revoke)
+        check("about to expire", fake, api, about_to_expire)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for the Vision AI API: /auth/token and paginated GET
+# endpoints served from in-memory lists, with the token calls counted,
+# tokens that can be revoked to simulate expiry on the server side and
+# injected faults (errors, slow responses, dropped connections).
+# build_endpoints makes the catalog of the app (cameras, active cameras,
+# objects and prompts) out of the mock payload, at any fleet size.
+import copy
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MOCK_DATA_PATH = "./data/temp/mock_api_data.json"
+ACTIVE_CAMERAS_PATH = "/agents/89173394-ee85-4613-8d2b-b0f860c26b0f/cameras"
+
+# probabilities of each fault per GET, and the pages that always fail
+NO_FAULTS = {
+    "error_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_delay": 2.0,
+    "drop_rate": 0.0,
+    "latency": 0.0,
+    "item_latency": 0.0,
+    "failing_pages": [],
+}
+
+
+class FakeVisionAI:
+    def __init__(
+        self, endpoints=None, username="user", password="password", faults=None, seed=0
+    ):
+        # endpoints maps a path to the list of items it pages through
+        self.endpoints = endpoints or {}
+        self.faults = {**NO_FAULTS, **(faults or {})}
+        self.rng = random.Random(seed)
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.token_calls = 0
+        self.requests = 0
+        self.unauthorized = 0
+        self.injected = {"error": 0, "slow": 0, "drop": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def revoke(self):
+        # every token issued so far gets a 401 from now on
+        with self.lock:
+            self.tokens.clear()
+
+    def issue_token(self, form):
+        if form.get("username") != [self.username] or form.get("password") != [
+            self.password
+        ]:
+            return 401, {"detail": "Incorrect username or password"}
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.token_calls += 1
+            self.tokens.add(token)
+        return 200, {"access_token": token, "token_type": "bearer"}
+
+    def get(self, url, authorization):
+        with self.lock:
+            self.requests += 1
+            authorized = authorization.removeprefix("Bearer ") in self.tokens
+            if not authorized:
+                self.unauthorized += 1
+        if not authorized:
+            return 401, {"detail": "Could not validate credentials"}
+
+        url = urlparse(url)
+        path = url.path.rstrip("/")
+        items = self.endpoints.get(path)
+        if items is None:
+            # /cameras/{id} returns the item of /cameras with that id
+            parent, _, item_id = path.rpartition("/")
+            for item in self.endpoints.get(parent) or []:
+                if str(item.get("id")) == item_id:
+                    time.sleep(self.faults["latency"])
+                    return 200, item
+            return 404, {"detail": "Not Found"}
+        query = parse_qs(url.query)
+        page = int(query.get("page", ["1"])[0])
+
+        fault = self.fault(page)
+        if fault == "drop":
+            return None, None
+        if fault == "error":
+            return 503, {"detail": "Service Unavailable"}
+        time.sleep(self.faults["latency"])
+        if fault == "slow":
+            time.sleep(self.faults["slow_delay"])
+        size = int(query.get("size", ["50"])[0])
+        start, end = (page - 1) * size, page * size
+        # serializing a page costs time per item on top of the fixed latency
+        time.sleep(self.faults["item_latency"] * len(items[start:end]))
+        return 200, {
+            "items": items[start:end],
+            "total": len(items),
+            "page": page,
+            "size": size,
+            "pages": -(-len(items) // size),
+        }
+
+    def fault(self, page):
+        faults = self.faults
+        with self.lock:
+            draw = self.rng.random()
+            if page in faults["failing_pages"]:
+                fault = "error"
+            elif draw < faults["error_rate"]:
+                fault = "error"
+            elif draw < faults["error_rate"] + faults["drop_rate"]:
+                fault = "drop"
+            elif (
+                draw < faults["error_rate"] + faults["drop_rate"] + faults["slow_rate"]
+            ):
+                fault = "slow"
+            else:
+                return None
+            self.injected[fault] += 1
+        return fault
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                form = parse_qs(self.rfile.read(length).decode())
+                if urlparse(self.path).path != "/auth/token":
+                    return self.reply(404, {"detail": "Not Found"})
+                self.reply(*fake.issue_token(form))
+
+            def do_GET(self):
+                self.reply(*fake.get(self.path, self.headers.get("Authorization", "")))
+
+            def reply(self, status, body):
+                if status is None:
+                    # connection dropped without a response
+                    self.close_connection = True
+                    return
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def scale_cameras(cameras, n_cameras=None, identifications_per_camera=None):
+    # repeats the fleet until it has n_cameras, with distinct camera ids. With
+    # identifications_per_camera every camera gets that many identifications,
+    # taken in turn from the ones of the payload, with distinct ids
+    n_cameras = n_cameras or len(cameras)
+    pool = [i for camera in cameras for i in camera.get("identifications") or []]
+    scaled = []
+    while len(scaled) < n_cameras:
+        copy_number = len(scaled) // len(cameras)
+        for camera in cameras[: n_cameras - len(scaled)]:
+            camera = copy.deepcopy(camera)
+            if copy_number:
+                camera["id"] = f"{camera['id']}-{copy_number}"
+            if identifications_per_camera is not None:
+                start = len(scaled) * identifications_per_camera
+                identifications = []
+                for n in range(identifications_per_camera):
+                    identification = copy.deepcopy(pool[(start + n) % len(pool)])
+                    identification["id"] = f"{camera['id']}-{n}"
+                    identification["snapshot"]["camera_id"] = camera["id"]
+                    identifications.append(identification)
+                camera["identifications"] = identifications
+            scaled.append(camera)
+    return scaled
+
+
+def build_endpoints(cameras, n_cameras=None, identifications_per_camera=None):
+    # the cameras with identifications are the active ones, /objects has the
+    # objects and labels found in the identifications and /prompts one prompt
+    cameras = scale_cameras(cameras, n_cameras, identifications_per_camera)
+    labels = {}
+    for camera in cameras:
+        for identification in camera.get("identifications") or []:
+            values = labels.setdefault(identification["object"], [])
+            if identification["label"] not in values:
+                values.append(identification["label"])
+    objects = [
+        {
+            "id": f"object-{n}",
+            "name": name,
+            "slug": name,
+            "labels": [
+                {
+                    "id": f"object-{n}-{value}",
+                    "value": value,
+                    "criteria": f"{name} is {value}",
+                    "identification_guide": f"Check whether {name} is {value}",
+                }
+                for value in values
+            ],
+        }
+        for n, (name, values) in enumerate(sorted(labels.items()))
+    ]
+    prompts = [
+        {
+            "id": "prompt-0",
+            "name": "base",
+            "prompt_text": "Objects:\n{objects_table_md}\n"
+            "Schema:\n{output_schema}\nExample:\n{output_example}",
+            "objects": sorted(labels),
+        }
+    ]
+    return {
+        "/cameras": cameras,
+        ACTIVE_CAMERAS_PATH: [
+            camera for camera in cameras if camera["identifications"]
+        ],
+        "/objects": objects,
+        "/prompts": prompts,
+    }
+
+
+def load_endpoints(n_cameras=None, identifications_per_camera=None):
+    with open(MOCK_DATA_PATH) as f:
+        cameras = json.load(f)
+    return build_endpoints(cameras, n_cameras, identifications_per_camera)
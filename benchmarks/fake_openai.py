@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for the OpenAI chat-completions endpoint and for the bucket
+# of snapshots. GET /images/{n}/{name} serves the sample images of
+# data/imgs, or the images given, in turn. POST /v1/chat/completions
+# answers whether the image sent looks like one of the flooded samples,
+# after a fixed latency and the time to upload the request at upload_rate
+# bytes per second. Counts the calls, the bytes received and the most calls
+# in flight at once, and can answer some calls with a rate limit error.
+import base64
+import io
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from PIL import Image
+
+IMAGES_PATH = "./data/imgs"
+COMPLETIONS_PATH = "/v1/chat/completions"
+
+
+def thumbnail(content):
+    # 8x8 grays, the same for an image resized or encoded again
+    with Image.open(io.BytesIO(content)) as img:
+        return list(img.convert("L").resize((8, 8)).getdata())
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        latency=0.2,
+        download_latency=0.05,
+        error_rate=0.0,
+        upload_rate=None,
+        images=None,
+        seed=0,
+    ):
+        self.latency = latency
+        self.download_latency = download_latency
+        self.error_rate = error_rate
+        self.upload_rate = upload_rate
+        self.rng = random.Random(seed)
+        samples = []
+        for name in sorted(os.listdir(IMAGES_PATH)):
+            with open(os.path.join(IMAGES_PATH, name), "rb") as f:
+                samples.append((name, f.read()))
+        self.thumbnails = [
+            (thumbnail(content), not name.startswith("not_"))
+            for name, content in samples
+        ]
+        # (name, bytes) of the images served, the samples by default
+        self.images = images or samples
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.bytes_received = 0
+        self.downloads = 0
+        self.errors = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def completions_url(self):
+        return self.url + COMPLETIONS_PATH
+
+    def image_url(self, n):
+        name, _ = self.images[n % len(self.images)]
+        return f"{self.url}/images/{n}/{name}"
+
+    def expected_label(self, url):
+        return not url.rsplit("/", 1)[1].startswith("not_")
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def image(self, path):
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "images" or not parts[1].isdigit():
+            return None
+        time.sleep(self.download_latency)
+        with self.lock:
+            self.downloads += 1
+        return self.images[int(parts[1]) % len(self.images)][1]
+
+    def is_flooded(self, content):
+        # answers as for the closest sample
+        pixels = thumbnail(content)
+        distances = [
+            (sum(abs(a - b) for a, b in zip(pixels, sample)), flooded)
+            for sample, flooded in self.thumbnails
+        ]
+        return min(distances)[1]
+
+    def complete(self, payload, n_bytes=0):
+        with self.lock:
+            self.calls += 1
+            self.bytes_received += n_bytes
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            rate_limited = self.rng.random() < self.error_rate
+            if rate_limited:
+                self.errors += 1
+        try:
+            time.sleep(self.latency)
+            if self.upload_rate:
+                time.sleep(n_bytes / self.upload_rate)
+            if rate_limited:
+                return 429, {
+                    "error": {"type": "rate_limit_exceeded", "message": "Slow down"}
+                }
+            url = payload["messages"][0]["content"][1]["image_url"]["url"]
+            content = base64.b64decode(url.split(",", 1)[1])
+            answer = json.dumps({"flooding_detected": self.is_flooded(content)})
+            return 200, {
+                "choices": [{"message": {"role": "assistant", "content": answer}}]
+            }
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length))
+                if urlparse(self.path).path != COMPLETIONS_PATH:
+                    return self.reply(404, {"error": {"message": "Not Found"}})
+                self.reply(*fake.complete(payload, length))
+
+            def do_GET(self):
+                content = fake.image(urlparse(self.path).path)
+                if content is None:
+                    return self.reply(404, {"error": {"message": "Not Found"}})
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def reply(self, status, body):
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
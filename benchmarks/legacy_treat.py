@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# treat_data as it was before the single pass engine in utils/treat.py, kept as
+# the baseline (speed and output) for the benchmarks
+import pandas as pd
+from utils.treat import TRADUTOR
+
+
+def treat_data(response):
+    cameras_aux = pd.read_csv("./data/database/cameras_aux.csv", dtype=str)
+
+    cameras_aux = cameras_aux.rename(columns={"id_camera": "camera_id"})
+    cameras = pd.DataFrame(response)
+    cameras = cameras.rename(columns={"id": "camera_id"})
+    cameras = cameras[cameras["identifications"].apply(lambda x: len(x) > 0)]
+    if len(cameras) == 0:
+        return None, None
+    cameras = cameras.merge(cameras_aux, on="camera_id", how="left")
+    # st.dataframe(cameras)
+
+    cameras_attr = cameras[
+        [
+            "camera_id",
+            "bairro",
+            "subprefeitura",
+            "name",
+            # "rtsp_url",
+            # "update_interval",
+            "latitude",
+            "longitude",
+            "identifications",
+            # "snapshot_url",
+            # "id_h3",
+            # "id_bolsao",
+            # "bolsao_latitude",
+            # "bolsao_longitude",
+            # "bolsao_classe_atual",
+            # "bacia",
+            # "sub_bacia",
+            # "geometry_bolsao_buffer_0.002",
+        ]
+    ]
+
+    cameras_identifications_explode = explode_df(
+        cameras_attr, "identifications"
+    )  # noqa
+
+    cameras_identifications_explode = cameras_identifications_explode.rename(
+        columns={"id": "object_id"}
+    ).rename(columns={"camera_id": "id"})
+    cameras_identifications_explode = cameras_identifications_explode.rename(
+        columns={
+            "snapshot.id": "snapshot_id",
+            "snapshot.camera_id": "snapshot_camera_id",
+            "snapshot.image_url": "snapshot_url",
+            "snapshot.timestamp": "snapshot_timestamp",
+        }
+    )
+
+    cameras_identifications_explode["timestamp"] = pd.to_datetime(
+        cameras_identifications_explode["timestamp"], format="ISO8601"
+    ).dt.tz_convert("America/Sao_Paulo")
+
+    cameras_identifications_explode["snapshot_timestamp"] = pd.to_datetime(
+        cameras_identifications_explode["snapshot_timestamp"], format="ISO8601"
+    ).dt.tz_convert("America/Sao_Paulo")
+
+    cameras_identifications_explode = (
+        cameras_identifications_explode.sort_values(  # noqa
+            ["timestamp", "label"], ascending=False
+        )
+    )
+
+    # remove "image_description" from the objects
+    cameras_identifications_explode = cameras_identifications_explode[
+        cameras_identifications_explode["object"] != "image_description"
+    ]
+
+    # remove "null" from the labels
+    cameras_identifications_explode = cameras_identifications_explode[
+        cameras_identifications_explode["label"] != "null"
+    ]
+
+    # # create a column order to sort the labels
+    cameras_identifications_explode = create_order_column(
+        cameras_identifications_explode
+    )
+    # sort the table first by object then by the column order
+    cameras_identifications_explode = cameras_identifications_explode.sort_values(
+        ["object", "order"]
+    )
+
+    # translate the labels of the columns object and label to portuguese using the dictionary above
+    cameras_identifications_explode["object"] = cameras_identifications_explode[
+        "object"
+    ].map(TRADUTOR)
+    cameras_identifications_explode["label"] = cameras_identifications_explode[
+        "label"
+    ].map(TRADUTOR)
+
+    # # print one random row of the dataframe in list format so I can see all the columns
+    # print(cameras_identifications_explode.sample(1).values.tolist())
+
+    # # print all columns of cameras_identifications_explode
+    # print(cameras_identifications_explode.columns)
+
+    return cameras_identifications_explode
+
+
+def explode_df(dataframe, column_to_explode, prefix=None):
+    df = dataframe.copy()
+    exploded_df = df.explode(column_to_explode)
+    new_df = pd.json_normalize(exploded_df[column_to_explode])
+
+    if prefix:
+        new_df = new_df.add_prefix(f"{prefix}_")
+
+    df.drop(columns=column_to_explode, inplace=True)
+    new_df.index = exploded_df.index
+    result_df = df.join(new_df)
+
+    return result_df
+
+
+def create_order_column(table):
+    # dict with the order of the labels from the worst to the best
+    order = {
+        "road_blockade": [
+            "totally",
+            "partially",
+            "free",
+        ],
+        "traffic": [
+            "impossible",
+            "difficult",
+            "moderate",
+            "easy",
+        ],
+        "rain": [
+            "true",
+            "false",
+        ],
+        "water_level": [
+            "high",
+            "medium",
+            "low",
+        ],
+        "image_corrupted": [
+            "true",
+            "false",
+        ],
+    }
+
+    # create a column order with the following rules:
+    # 1. if the object is not in the order keys dict, return 99
+    # 2. if the object is in the order keys, return the index of the label in the order list
+
+    # knowing that the dataframe always have the columns object and label, we can use the following code
+    table["order"] = table.apply(
+        lambda row: order.get(row["object"], 99).index(row["label"]), axis=1
+    )
+
+    return table
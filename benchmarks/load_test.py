@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the Home page: many sessions driven headlessly with Streamlit's
+AppTest against the fake Vision AI API, all in one process as in the
+Streamlit server. Each session logs in, then keeps changing the object
+filter, the label multiselect or the selected row. Every concurrency level
+runs in a new process, which reports the rerun latency percentiles, the CPU
+time per rerun and its peak RSS.
+
+AppTest can't click on the AgGrid component, so the row selection is made
+by the session and returned by the grid in place of the browser's. AppTest
+also creates and removes a process-wide runtime on each run, the sessions
+share one runtime instead so they can run concurrently.
+
+  python benchmarks/load_test.py [--sessions 1 2 4 8] [--reruns N]
+      [--cameras N] [--latency SECONDS] [--json PATH]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, "./benchmarks")
+
+from fake_api import FakeVisionAI, load_endpoints  # noqa: E402
+
+HOME_PATH = "app/Home.py"
+# production pods get half a core each
+CPU_LIMIT = 0.5
+# session_state key with the camera the simulated operator clicked on
+SELECTED_ID_KEY = "_load_test_selected_id"
+ACTIONS = ["object", "labels", "row"]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def share_app_test_runtime():
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage import dummy_cache_storage
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = dummy_cache_storage.MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    class RunRuntime(Runtime):
+        # takes the runtime set up and removed by each run
+        pass
+
+    app_test.Runtime = RunRuntime
+    # set once, patching it on each run isn't thread-safe
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+
+def select_rows_from_session():
+    # the grid still runs, its selection is replaced by the session's one
+    import streamlit as st
+    import utils.utils as app_utils
+
+    aggrid = app_utils.AgGrid
+
+    def AgGrid(table, *args, **kwargs):
+        response = dict(aggrid(table, *args, **kwargs) or {})
+        camera_id = st.session_state.get(SELECTED_ID_KEY)
+        rows = table[table["id"] == camera_id].head(1)
+        response["selected_rows"] = rows.to_dict("records") if camera_id else []
+        return response
+
+    app_utils.AgGrid = AgGrid
+
+
+def run_session(n_reruns, seed, barrier, latencies, errors):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    try:
+        at = AppTest.from_file(HOME_PATH, default_timeout=300).run()
+        at.text_input(key="username").set_value("user")
+        at.text_input(key="password").set_value("password")
+        at.button[0].click().run()
+    except Exception as exc:
+        errors.append(f"login: {exc!r}")
+        barrier.abort()
+        return
+    barrier.wait()
+
+    for _ in range(n_reruns):
+        action = rng.choice(ACTIONS)
+        if not at.selectbox:
+            action = "reload"
+        elif action == "object":
+            at.selectbox[0].select(rng.choice(at.selectbox[0].options))
+        elif action == "labels":
+            options = at.multiselect[0].options
+            at.multiselect[0].set_value(
+                rng.sample(options, rng.randint(1, len(options)))
+            )
+        else:
+            camera_ids = []
+            if "_load_test_ids" in at.session_state:
+                camera_ids = at.session_state["_load_test_ids"]
+            at.session_state[SELECTED_ID_KEY] = rng.choice(camera_ids or [None])
+        start = time.perf_counter()
+        at.run()
+        latencies.append((action, time.perf_counter() - start))
+        if at.exception:
+            errors.append(str(at.exception[0].value))
+
+
+def worker(n_sessions, n_reruns):
+    # one concurrency level, in its own process. Prints its results as JSON
+    sys.path.insert(0, "./app")
+    import streamlit as st
+    import utils.utils as app_utils
+
+    share_app_test_runtime()
+    select_rows_from_session()
+    # remembers the rows the operator can click on in this rerun
+    prepare = app_utils.prepare_aggrid_table
+
+    def prepare_aggrid_table(df):
+        table = prepare(df)
+        st.session_state["_load_test_ids"] = table["id"].head(50).tolist()
+        return table
+
+    app_utils.prepare_aggrid_table = prepare_aggrid_table
+
+    latencies, errors = [], []
+    barrier = threading.Barrier(n_sessions + 1)
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(n_reruns, seed, barrier, latencies, errors),
+            daemon=True,
+        )
+        for seed in range(n_sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    # the clock starts once every session logged in and got its first page
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        print(json.dumps({"sessions": n_sessions, "errors": errors[:5]}))
+        return
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    seconds = [latency for _, latency in latencies]
+    by_action = {}
+    for action, latency in latencies:
+        by_action.setdefault(action, []).append(latency)
+    print(
+        json.dumps(
+            {
+                "sessions": n_sessions,
+                "reruns": len(seconds),
+                "errors": errors[:5],
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "p50": percentile(seconds, 0.5),
+                "p95": percentile(seconds, 0.95),
+                "p99": percentile(seconds, 0.99),
+                "p95_by_action": {
+                    action: percentile(values, 0.95)
+                    for action, values in by_action.items()
+                },
+                # kilobytes on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def run_level(n_sessions, n_reruns, env):
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--worker",
+            "--sessions",
+            str(n_sessions),
+            "--reruns",
+            str(n_reruns),
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(output.stdout.splitlines()):
+        if line.startswith("{"):
+            result = json.loads(line)
+            if "reruns" not in result:
+                raise RuntimeError(f"sessions failed to log in: {result['errors']}")
+            return result
+    raise RuntimeError(f"worker failed:\n{output.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--cameras", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.sessions[0], args.reruns)
+
+    results = []
+    endpoints = load_endpoints(args.cameras)
+    faults = {"latency": args.latency}
+    store = tempfile.TemporaryDirectory()
+    with FakeVisionAI(endpoints, faults=faults) as fake, store:
+        env = {
+            **os.environ,
+            "VISION_AI_API_URL": fake.url,
+            "SNAPSHOT_STORE_PATH": store.name,
+            # every worker would try to bind the same port
+            "METRICS_PORT": "0",
+        }
+        print(
+            f"{'sessions':>8} {'reruns':>7} {'p50':>8} {'p95':>8} {'p99':>8}"
+            f" {'cpu/rerun':>10} {'reruns/s':>9} {'@500m':>7} {'peak rss':>9}"
+        )
+        for n_sessions in args.sessions:
+            result = run_level(n_sessions, args.reruns, env)
+            results.append(result)
+            cpu_per_rerun = result["cpu_seconds"] / result["reruns"]
+            print(
+                f"{n_sessions:>8} {result['reruns']:>7}"
+                f" {result['p50']:>7.2f}s {result['p95']:>7.2f}s"
+                f" {result['p99']:>7.2f}s {cpu_per_rerun * 1000:>7.0f} ms"
+                f" {result['reruns'] / result['wall_seconds']:>9.1f}"
+                f" {CPU_LIMIT / cpu_per_rerun:>7.1f}"
+                f" {result['peak_rss_mb']:>6.0f} MB"
+            )
+            if result["errors"]:
+                print(f"  errors: {result['errors']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()